@@ -11,17 +11,18 @@ import logging
 
 import pkg_resources
 
-from .rc_config import _loadrc
+from .rc_config import _LazyRC
 
 logger = logging.getLogger(__name__)
 
 
 __version__ = pkg_resources.require(__name__)[0].version
 
-# Loads the rc user preferences
-rc = _loadrc()
+# Loads the rc user preferences on first access
+rc = _LazyRC()
 """The content of the global configuration file loaded as a dictionary.
-The value for any non-existing key is ``None``."""
+The value for any non-existing key is ``None``. The file is only read the
+first time a value is accessed."""
 
 
 @contextlib.contextmanager
@@ -38,14 +39,14 @@ def rc_context(dict):
     ...     a = rc.get("non-existing-key")
     >>> a
     1
+
+    The values are overridden without copying the rc and only for the current
+    thread or asyncio task (and the tasks it creates). Use
+    :py:func:`bob.extension.rc_config.with_rc_context` to pass them to the
+    functions that run in thread pools.
     """
-    old_rc = rc.copy()
-    try:
-        rc.update(dict)
+    with rc.overlay(dict):
         yield
-    finally:
-        rc.clear()
-        rc.update(old_rc)
 
 
 def get_config(package=__name__, externals=None, api_version=None):
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""A registry of the files that packages download through
+:py:func:`bob.extension.download.get_file`.
+
+Packages declare their artifacts (the arguments they give to
+:py:func:`bob.extension.download.get_file`) through the ``bob.artifacts`` entry
+point group, for example in their ``setup.py``::
+
+    entry_points={
+        "bob.artifacts": [
+            "mnist = bob.db.mnist.config:mnist_artifact",
+        ],
+    },
+
+where ``mnist_artifact`` is a dictionary (or a list of dictionaries) like::
+
+    mnist_artifact = {
+        "filename": "mnist.tar.bz2",
+        "urls": ["https://www.idiap.ch/software/bob/data/mnist.tar.bz2"],
+        "cache_subdir": "databases",
+        "file_hash": "d72c7e80534d980d1df23f78242c595a",
+    }
+
+All artifacts can then be downloaded at once (e.g. on a login node with network
+access) with ``bob data prefetch``, which also writes a manifest of the
+downloaded files. On nodes without network access, set::
+
+    $ bob config set bob_data_manifest /path/to/manifest.json
+    $ bob config set bob_data_offline true
+
+so that :py:func:`bob.extension.download.get_file` validates the cached files
+against the manifest and fails immediately, instead of trying to reach the
+network, when a file was not prefetched. The cached files are only checked
+against the sizes recorded in the manifest (their hashes are only checked when
+a ``file_hash`` is given to :py:func:`bob.extension.download.get_file`).
+"""
+
+import functools
+import json
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pkg_resources
+
+from . import download, rc
+from .rc_config import with_rc_context
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "bob.artifacts"
+"""The entry point group in which packages declare their artifacts"""
+
+MANIFEST_KEY = "bob_data_manifest"
+"""The rc key holding the path to the manifest of prefetched files"""
+
+_ARTIFACT_KEYS = (
+    "filename",
+    "urls",
+    "cache_subdir",
+    "file_hash",
+    "hash_algorithm",
+    "extract",
+)
+
+
+def _manifest_key(filename, cache_subdir):
+    return "/".join([cache_subdir, filename])
+
+
+def list_artifacts(entry_point_group=ENTRY_POINT_GROUP, names=None):
+    """Lists the artifacts declared through entry points.
+
+    Parameters
+    ----------
+    entry_point_group : str
+        The entry point group to look into.
+    names : :obj:`list`, optional
+        If given, only the artifacts of the entry points with these names are
+        returned.
+
+    Returns
+    -------
+    list
+        The artifacts, each one being a dictionary with the arguments of
+        :py:func:`bob.extension.download.get_file`.
+
+    Raises
+    ------
+    ValueError
+        If an artifact misses the ``filename`` or the ``urls`` or has unknown
+        keys.
+    """
+    artifacts = []
+    for entry_point in pkg_resources.iter_entry_points(entry_point_group):
+        if names and entry_point.name not in names:
+            continue
+        declared = entry_point.load()
+        if isinstance(declared, dict):
+            declared = [declared]
+        for artifact in declared:
+            unknown = set(artifact) - set(_ARTIFACT_KEYS)
+            if unknown or not {"filename", "urls"} <= set(artifact):
+                raise ValueError(
+                    "The artifact `{}' of the entry point `{}' must define "
+                    "`filename' and `urls' and may only define: {}".format(
+                        artifact, entry_point.name, ", ".join(_ARTIFACT_KEYS)
+                    )
+                )
+            artifacts.append(dict(artifact))
+    return artifacts
+
+
+def prefetch(artifacts, jobs=4):
+    """Downloads artifacts in parallel and returns their manifest.
+
+    Parameters
+    ----------
+    artifacts : list
+        The artifacts, as returned by :py:func:`list_artifacts`.
+    jobs : int
+        The number of artifacts downloaded at the same time.
+
+    Returns
+    -------
+    dict
+        The manifest of the downloaded files, see :py:func:`write_manifest`.
+    """
+
+    def fetch(artifact):
+        path = download.get_file(**artifact)
+        artifact = dict(artifact)
+        artifact.setdefault("cache_subdir", "datasets")
+        return artifact, {
+            "size": os.path.getsize(path),
+            "sha256": download._hash_file(path, "sha256"),
+            "urls": list(artifact["urls"]),
+        }
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(with_rc_context(fetch), artifacts))
+
+    return {
+        _manifest_key(a["filename"], a["cache_subdir"]): entry
+        for a, entry in results
+    }
+
+
+def write_manifest(manifest, path):
+    """Writes a manifest of prefetched files.
+
+    Parameters
+    ----------
+    manifest : dict
+        A dictionary mapping ``<cache_subdir>/<filename>`` to the ``size``, the
+        ``sha256`` hash and the ``urls`` of each file.
+    path : str
+        Where to write the manifest.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wt") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=8)
+def _read_manifest(path, mtime_ns):
+    with open(path, "rt") as f:
+        return json.load(f)
+
+
+def load_manifest(path=None):
+    """Loads the manifest of prefetched files.
+
+    Parameters
+    ----------
+    path : :obj:`str`, optional
+        Path to the manifest. Defaults to the value of the ``bob_data_manifest``
+        rc key.
+
+    Returns
+    -------
+    dict or None
+        The manifest, or None if no manifest is configured or if it does not
+        exist yet. The manifest is only re-read when the file changes.
+
+    Raises
+    ------
+    RuntimeError
+        If the manifest does not exist and ``bob_data_offline`` is set.
+    """
+    path = path or rc.get(MANIFEST_KEY)
+    if path is None:
+        return None
+    path = os.path.expanduser(path)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        if download._rc_flag("bob_data_offline", False):
+            raise RuntimeError(
+                f"The manifest of prefetched files `{path}' does not exist and "
+                f"bob_data_offline is set. Please run `bob data prefetch' on a "
+                f"machine with network access."
+            )
+        logger.debug("The manifest `%s' does not exist yet", path)
+        return None
+    return _read_manifest(path, mtime_ns)
+
+
+def check_manifest(path, filename, cache_subdir):
+    """Checks a cached file against the manifest, without reading it.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cached file.
+    filename : str
+        The name of the file as given to
+        :py:func:`bob.extension.download.get_file`.
+    cache_subdir : str
+        The cache sub-directory as given to
+        :py:func:`bob.extension.download.get_file`.
+
+    Returns
+    -------
+    bool
+        False if the file is listed in the manifest with a different size. The
+        ``sha256`` of the manifest is not checked, as hashing large files on
+        every access would be too slow.
+    """
+    manifest = load_manifest()
+    if manifest is None:
+        return True
+    entry = manifest.get(_manifest_key(filename, cache_subdir))
+    if entry is None:
+        return True
+    return os.path.getsize(path) == entry["size"]
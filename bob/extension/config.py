@@ -4,8 +4,16 @@
 """Functionality to implement python-based config file parsing and loading.
 """
 
+import ast
+import contextlib
+import hashlib
+import importlib.machinery
+import importlib.util
 import logging
+import os
 import pkgutil
+import sys
+import time
 import types
 
 from collections import defaultdict
@@ -18,6 +26,79 @@ logger = logging.getLogger(__name__)
 LOADED_CONFIGS = []
 
 
+_UNSET = object()
+
+
+class LazyValue:
+    """A configuration value that is only built when it is used.
+
+    Wrap the expensive objects of a config file so that they are only built if
+    a command consumes them, through :any:`ResourceOption` or through
+    :any:`load` with an ``attribute_name``::
+
+        database = LazyValue(Database, protocol="dev")
+
+        @LazyValue
+        def extractor():
+            from bob.bio.face.extractor import DCTBlocks
+
+            return DCTBlocks()
+
+    The positional and keyword arguments that are themselves lazy values are
+    built first, so lazy values can be composed across chain-loaded config
+    files.
+
+    Parameters
+    ----------
+    func : callable
+        Builds the value.
+    *args
+        Positional arguments given to ``func``.
+    **kwargs
+        Keyword arguments given to ``func``.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._value = _UNSET
+
+    def get(self):
+        """Builds the value (only the first time) and returns it."""
+        if self._value is _UNSET:
+            logger.debug("Building the lazy value %r", self)
+            args = [materialize(a) for a in self.args]
+            kwargs = {k: materialize(v) for k, v in self.kwargs.items()}
+            self._value = self.func(*args, **kwargs)
+        return self._value
+
+    def __repr__(self):
+        name = getattr(self.func, "__qualname__", repr(self.func))
+        return f"LazyValue({name})"
+
+
+def materialize(value):
+    """Returns the value of a :any:`LazyValue`, or ``value`` unchanged if it is
+    not lazy."""
+    if isinstance(value, LazyValue):
+        return value.get()
+    return value
+
+
+@contextlib.contextmanager
+def _timed(timings, phase, name):
+    """Logs (and appends to ``timings``) the time spent in the context."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        logger.debug("Phase `%s' of `%s' took %.3fs", phase, name, elapsed)
+        if timings is not None:
+            timings.append({"phase": phase, "name": name, "time": elapsed})
+
+
 def _load_context(path, mod):
     """Loads the Python file as module, returns a resolved context
 
@@ -50,9 +131,52 @@ def _load_context(path, mod):
     return mod
 
 
+# the paths of the modules found by _find_module_filename
+_MODULE_FILENAMES = {}
+
+
+def _search_locations(parts, spec):
+    """Where to look for the sub-modules of the package named by ``parts``."""
+    parent = sys.modules.get(".".join(parts))
+    if hasattr(parent, "__path__"):
+        return list(parent.__path__)
+    # bob packages are split across sys.path entries through
+    # pkgutil.extend_path, which only runs when the package is imported
+    locations = list(spec.submodule_search_locations)
+    for entry in sys.path:
+        portion = os.path.join(entry or os.curdir, *parts)
+        if portion not in locations and os.path.isdir(portion):
+            locations.append(portion)
+    return locations
+
+
+def _find_module_filename(module_name):
+    key = (module_name, tuple(sys.path))
+    if key in _MODULE_FILENAMES:
+        return _MODULE_FILENAMES[key]
+    parts = module_name.split(".")
+    # a top-level module is found without importing anything
+    spec = importlib.util.find_spec(parts[0])
+    for i in range(1, len(parts)):
+        if spec is None or spec.submodule_search_locations is None:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(
+            ".".join(parts[: i + 1]), _search_locations(parts[:i], spec)
+        )
+    if spec is None or not spec.has_location:
+        return None
+    _MODULE_FILENAMES[key] = spec.origin
+    return spec.origin
+
+
 def _get_module_filename(module_name):
     """Resolves a module name to an actual Python file.
 
+    The parent packages of the module are searched for on their search path,
+    without importing them (their ``__init__.py`` files may import heavy
+    dependencies). If the module is not found this way, the parent packages are
+    imported to find it. The resolved paths are memoized.
+
     Parameters
     ----------
     module_name : str
@@ -63,6 +187,13 @@ def _get_module_filename(module_name):
     str
         The Python files that corresponds to the module name.
     """
+    try:
+        path = _find_module_filename(module_name)
+    except (ImportError, ValueError):
+        # e.g. a module of sys.modules without a spec
+        path = None
+    if path is not None:
+        return path
     loader = pkgutil.get_loader(module_name)
     if loader is None:
         return ""
@@ -163,7 +294,212 @@ def _resolve_entry_point_or_modules(paths, entry_point_group, common_name=None):
     return files, module_names, object_names
 
 
-def load(paths, context=None, entry_point_group=None, attribute_name=None):
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _names_read(tree):
+    """Returns the names that the code of ``tree`` may read, in any scope."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.AugAssign) and isinstance(
+            node.target, ast.Name
+        ):
+            names.add(node.target.id)
+    return names
+
+
+_SCOPES = (
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.Lambda,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+    ast.GeneratorExp,
+)
+
+
+def _module_level_nodes(tree):
+    """Yields the nodes of ``tree`` that are executed in the module scope."""
+    nodes = list(ast.iter_child_nodes(tree))
+    while nodes:
+        node = nodes.pop()
+        yield node
+        if not isinstance(node, _SCOPES):
+            nodes.extend(ast.iter_child_nodes(node))
+
+
+def _analyze_source(source, path):
+    tree = ast.parse(source, path)
+    defines, deletes = set(), set()
+    for node in _module_level_nodes(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Store):
+                defines.add(node.id)
+            elif isinstance(node.ctx, ast.Del):
+                deletes.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != "*":
+                    defines.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        ):
+            defines.add(node.name)
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.add("." * node.level + (node.module or ""))
+    return {
+        "defines": defines,
+        "deletes": deletes,
+        "reads": _names_read(tree),
+        "imports": imports,
+    }
+
+
+# the analyses of the config files, by the sha256 of their contents
+_ANALYSES = {}
+
+
+def _analyze(path):
+    with open(path, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+    if digest not in _ANALYSES:
+        _ANALYSES[digest] = _analyze_source(source, path)
+    return _ANALYSES[digest]
+
+
+def introspect(paths, entry_point_group=None):
+    """Reports what a chain of configuration files defines, without executing
+    it.
+
+    The files are parsed with :py:mod:`ast` (the analyses are cached by the
+    hash of the files' contents), so this is much faster than :any:`load` for
+    checking which variables a chain of configuration files provides. The
+    names brought by ``from module import *`` are not reported.
+
+    Parameters
+    ----------
+    paths : [str]
+        The configuration files, entry point names or module names, as given
+        to :any:`load`.
+    entry_point_group : :py:class:`str`, optional
+        See :any:`load`.
+
+    Returns
+    -------
+    list
+        One dictionary per configuration file with its ``path``, the sorted
+        lists of the variables it ``defines`` (at the module level, including
+        imports, functions and classes), ``overrides`` (the defined variables
+        which were already defined by a previous file), ``deletes`` and
+        ``reads`` (in any scope), and of the modules it ``imports``.
+
+    Raises
+    ------
+    SyntaxError
+        If a configuration file cannot be parsed.
+    ValueError
+        If an entry point or a module cannot be resolved to a file.
+    """
+    if entry_point_group is not None:
+        paths = _resolve_entry_point_or_modules(paths, entry_point_group)[0]
+    available = set()
+    results = []
+    for path in paths:
+        analysis = _analyze(path)
+        result = {k: sorted(v) for k, v in analysis.items()}
+        result["path"] = path
+        result["overrides"] = sorted(analysis["defines"] & available)
+        available = (available | analysis["defines"]) - analysis["deletes"]
+        results.append(result)
+    return results
+
+
+class _ChainLink:
+    """What :any:`load` recorded about one file of a chain of config files:
+    the context it received, the variables it wrote or deleted and the
+    resulting module."""
+
+    def __init__(self, path, module_name, signature, context, mod):
+        self.path = path
+        self.module_name = module_name
+        self.signature = signature
+        self.context = context
+        self.mod = mod
+        self.writes = {
+            k: v
+            for k, v in mod.__dict__.items()
+            if not k.startswith("__")
+            and (k not in context or context[k] is not v)
+        }
+        self.deleted = set(context) - set(mod.__dict__)
+        self._reads = None
+
+    @classmethod
+    def execute(cls, path, module_name, context, timings=None):
+        logger.debug("Loading configuration file `%s'...", path)
+        signature = _file_signature(path)
+        mod = types.ModuleType(module_name)
+        mod.__dict__.update(context)
+        LOADED_CONFIGS.append(mod)
+        with _timed(timings, "execute", path):
+            mod = _load_context(path, mod)
+        return cls(path, module_name, signature, context, mod)
+
+    @property
+    def reads(self):
+        """The names of the context that the file may read (found by parsing
+        the file, which is unchanged since it was executed)."""
+        if self._reads is None:
+            self._reads = _analyze(self.path)["reads"]
+        return self._reads
+
+    def is_stale(self, context):
+        """Whether the file must be executed again with ``context``."""
+        if _file_signature(self.path) != self.signature:
+            return True
+        return any(
+            context.get(k, _UNSET) is not self.context.get(k, _UNSET)
+            for k in self.reads
+        )
+
+    def reuse(self, context):
+        """Returns a link with the results of this one applied to
+        ``context``, without executing the file."""
+        logger.debug("Reusing configuration file `%s'", self.path)
+        mod = types.ModuleType(self.module_name)
+        mod.__dict__.update(
+            {k: v for k, v in context.items() if k not in self.deleted}
+        )
+        mod.__dict__.update(self.writes)
+        LOADED_CONFIGS.append(mod)
+        link = _ChainLink(
+            self.path, self.module_name, self.signature, context, mod
+        )
+        link._reads = self._reads
+        return link
+
+
+def load(
+    paths,
+    context=None,
+    entry_point_group=None,
+    attribute_name=None,
+    timings=None,
+):
     """Loads a set of configuration files, in sequence
 
     This method will load one or more configuration files. Every time a
@@ -189,6 +525,11 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
         files. Paths ending with `some_path:variable_name` can override the
         attribute_name. The entry_point_group must provided as well
         attribute_name is not None.
+    timings : :py:class:`list`, optional
+        If provided, a ``{"phase": ..., "name": ..., "time": ...}`` dictionary
+        is appended to it for the resolution of the entry points (the
+        ``resolve`` phase) and for the execution of each configuration file
+        (the ``execute`` phase). The times are in seconds.
 
     Returns
     -------
@@ -196,7 +537,8 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
         A module representing the resolved context, after loading the provided
         modules and resolving all variables. If attribute_name is given, the
         object with the attribute_name name (or the name provided by user) is
-        returned instead of the module.
+        returned instead of the module (and built if it is a
+        :any:`LazyValue`).
 
     Raises
     ------
@@ -214,9 +556,10 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
 
     # resolve entry points to paths
     if entry_point_group is not None:
-        paths, names, object_names = _resolve_entry_point_or_modules(
-            paths, entry_point_group, attribute_name
-        )
+        with _timed(timings, "resolve", entry_point_group):
+            paths, names, object_names = _resolve_entry_point_or_modules(
+                paths, entry_point_group, attribute_name
+            )
     else:
         names = len(paths) * ["user_config"]
 
@@ -231,9 +574,8 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
     if not paths:
         return ctxt
 
+    chain = []
     for k, n in zip(paths, names):
-        logger.debug("Loading configuration file `%s'...", k)
-        mod = types.ModuleType(n)
         # remove the keys that might break the loading of the next config file.
         ctxt.__dict__.pop("__name__", None)
         ctxt.__dict__.pop("__package__", None)
@@ -241,9 +583,10 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
         context = {
             k: v for k, v in ctxt.__dict__.items() if not k.startswith("__")
         }
-        mod.__dict__.update(context)
-        LOADED_CONFIGS.append(mod)
-        ctxt = _load_context(k, mod)
+        link = _ChainLink.execute(k, n, context, timings)
+        chain.append(link)
+        ctxt = mod = link.mod
+    mod.__bob_config_chain__ = chain
 
     if not attribute_name:
         return mod
@@ -257,12 +600,169 @@ def load(paths, context=None, entry_point_group=None, attribute_name=None):
             "your configuration files: %s" % (attribute_name, ", ".join(paths))
         )
 
-    return getattr(mod, attribute_name)
+    return materialize(getattr(mod, attribute_name))
+
+
+# the values that cannot be modified in place, or that executing a file again
+# would not create again (e.g. imported modules)
+_IMMUTABLE_TYPES = (
+    type(None),
+    bool,
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    range,
+    types.ModuleType,
+)
+
+
+def _is_immutable(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(v) for v in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _links_to_execute(chain, context):
+    """Returns the indices of the links of ``chain`` that :any:`reload` must
+    execute again with the initial ``context``.
+
+    The reused files pass on the objects of the previous run, which the files
+    after them may have modified in place. So when a file is executed again,
+    the files that created the mutable objects it reads are executed again
+    too, and so are the other files that read these objects.
+    """
+    reads, writes = [], []
+    execute = set()
+    for i, link in enumerate(chain):
+        if _file_signature(link.path) != link.signature:
+            execute.add(i)
+            analysis = _analyze(link.path)
+            reads.append(analysis["reads"])
+            # the values of the variables that the file did not write before
+            # are unknown
+            writes.append(
+                {**dict.fromkeys(analysis["defines"], _UNSET), **link.writes}
+            )
+        else:
+            reads.append(link.reads)
+            writes.append(link.writes)
+
+    def inputs(k):
+        """Yields the name, value and writer index (-1 for the initial context)
+        of each variable that link ``k`` reads."""
+        for name in reads[k]:
+            for i in range(k - 1, -1, -1):
+                if name in writes[i]:
+                    yield name, writes[i][name], i
+                    break
+            else:
+                yield name, chain[0].context.get(name, _UNSET), -1
+
+    for k in range(len(chain)):
+        if any(
+            i == -1 and context.get(name, _UNSET) is not value
+            for name, value, i in inputs(k)
+        ):
+            execute.add(k)
+
+    def mutable_inputs(k):
+        return {
+            i
+            for _, value, i in inputs(k)
+            if i != -1 and (value is _UNSET or not _is_immutable(value))
+        }
+
+    changed = True
+    while changed:
+        changed = False
+        for k in range(len(chain)):
+            writers = mutable_inputs(k)
+            if k in execute:
+                new = writers - execute
+            elif writers & execute:
+                new = {k}
+            else:
+                continue
+            if new:
+                execute.update(new)
+                changed = True
+    return execute
+
+
+def reload(mod, context=None, timings=None):
+    """Reloads a chain of configuration files that was loaded by :any:`load`,
+    executing only the files that need it.
+
+    A file is executed again if it was modified since it was loaded or if a
+    variable that it reads (as found by parsing it) was changed by a file
+    executed before it. Since a file may modify the objects it reads in place
+    (e.g. ``lst.append(1)``), the files that created the mutable objects read
+    by an executed file are executed again too, and so are the other files
+    that read these objects. The results of the other files are reused, so
+    editing the last file of a long chain only executes that file and the
+    files it depends on::
+
+        config = load(["database.py", "experiment.py"])
+        ...  # experiment.py is edited
+        config = reload(config)
+
+    Parameters
+    ----------
+    mod : :any:`module`
+        The module returned by :any:`load` (called without
+        ``attribute_name``) or by a previous call to :any:`reload`.
+    context : :py:class:`dict`, optional
+        If provided, replaces the context given to the first configuration
+        file. Otherwise, the objects of the initial context are given again
+        to the files, including the changes that the files made to them.
+    timings : :py:class:`list`, optional
+        See :any:`load`.
+
+    Returns
+    -------
+    mod : :any:`module`
+        A module representing the resolved context, as returned by
+        :any:`load`.
+
+    Raises
+    ------
+    ValueError
+        If ``mod`` was not returned by :any:`load`.
+    """
+    chain = getattr(mod, "__bob_config_chain__", None)
+    if not chain:
+        raise ValueError(
+            "Only the modules returned by load (without attribute_name) can "
+            "be reloaded."
+        )
+    if context is None:
+        context = chain[0].context
+    context = {k: v for k, v in context.items() if not k.startswith("__")}
+
+    execute = _links_to_execute(chain, context)
+    new_chain = []
+    for i, link in enumerate(chain):
+        if i in execute or link.is_stale(context):
+            link = _ChainLink.execute(
+                link.path, link.module_name, context, timings
+            )
+        else:
+            link = link.reuse(context)
+        new_chain.append(link)
+        context = {
+            k: v for k, v in link.mod.__dict__.items() if not k.startswith("__")
+        }
+    mod = new_chain[-1].mod
+    mod.__bob_config_chain__ = new_chain
+    return mod
 
 
 def mod_to_context(mod):
     """Converts the loaded module of :any:`load` to a dictionary context.
-    This function removes all the variables that start and end with ``__``.
+    This function removes all the variables that start and end with ``__``. The
+    :any:`LazyValue` variables are not built.
 
     Parameters
     ----------
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+_data = Path(__file__).parent
+
+folders = [
+    {
+        "filename": "test_list_folders1.tar.gz",
+        "urls": [(_data / "test_list_folders1.tar.gz").as_uri()],
+        "cache_subdir": "test",
+        "extract": True,
+    },
+    {
+        "filename": "test_list_folders2.tar.gz",
+        "urls": [(_data / "test_list_folders2.tar.gz").as_uri()],
+        "cache_subdir": "test",
+    },
+]
+
+readme = {
+    "filename": "README.rst",
+    "urls": [(_data / "test_list_folders" / "README.rst").as_uri()],
+    "cache_subdir": "test",
+}
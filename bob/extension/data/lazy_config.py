@@ -0,0 +1,10 @@
+from bob.extension.config import LazyValue
+
+
+@LazyValue
+def heavy():
+    raise RuntimeError("This value should never be built")
+
+
+a = LazyValue(int, "1")
+b = LazyValue(lambda x: x + 2, a)
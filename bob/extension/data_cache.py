@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""Size-bounded management of the files downloaded into bob's data folder.
+
+Every file downloaded through :py:func:`bob.extension.download.get_file` is
+recorded in a small JSON index (``.bob_data_index.json``) at the root of the
+data folder together with its size and the files that were extracted from it.
+The later uses of a cached file only update its access time on the file system
+(see :py:func:`touch`), so cache hits neither lock nor rewrite the index. When
+a quota is configured, the least recently used entries are evicted until the
+folder fits in the quota::
+
+    $ bob config set bob_data_quota 50G
+"""
+
+import contextlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+from . import rc
+from .utils import file_lock
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".bob_data_index.json"
+"""Name of the index file kept at the root of the data folder"""
+
+LOCKS_FOLDER = ".locks"
+"""Name of the folder (inside the data folder) that contains the entry locks"""
+
+QUOTA_KEY = "bob_data_quota"
+"""The rc key holding the maximum size (in bytes, or with a K/M/G/T suffix) of
+the data folder"""
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def _data_folder(folder=None):
+    if folder is not None:
+        return folder
+    from .download import _bob_data_folder
+
+    return _bob_data_folder()
+
+
+def parse_size(value):
+    """Converts a size, such as ``1024``, ``"500M"`` or ``"1.5G"``, to bytes.
+
+    Parameters
+    ----------
+    value : int or str or None
+        The size to convert. Suffixes are powers of 1024.
+
+    Returns
+    -------
+    int or None
+        The size in bytes, or None if ``value`` is None.
+
+    Raises
+    ------
+    ValueError
+        If ``value`` cannot be parsed.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    match = re.fullmatch(
+        r"\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)i?B?\s*", str(value), re.IGNORECASE
+    )
+    if match is None:
+        raise ValueError(f"Could not parse the size: `{value}'")
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+
+def format_size(size):
+    """Formats a size in bytes in a human readable way (e.g. ``1.5G``)."""
+    for unit in ("", "K", "M", "G"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}" if unit else f"{size}B"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def _relpath(path, folder):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(folder))
+
+
+def _load_index(folder):
+    path = os.path.join(folder, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "rt") as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning("The cache index `%s' is corrupted; resetting it", path)
+        return {}
+
+
+def _save_index(folder, index):
+    path = os.path.join(folder, INDEX_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wt") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def _locked_index(folder):
+    """Yields the index of ``folder`` for a read-modify-write operation."""
+    os.makedirs(folder, exist_ok=True)
+    with file_lock(os.path.join(folder, LOCKS_FOLDER, INDEX_FILENAME)):
+        index = _load_index(folder)
+        yield index
+        _save_index(folder, index)
+
+
+def entry_lock(path, folder=None, shared=True, blocking=True):
+    """Locks a cache entry so that it is not evicted while it is being used.
+
+    :py:func:`bob.extension.download.get_file` takes an exclusive lock while it
+    downloads or extracts a file. Use a shared lock when reading a cached file
+    for a long time::
+
+        with entry_lock(path):
+            train(path)
+
+    Parameters
+    ----------
+    path : str
+        The path to the cached file.
+    folder : :obj:`str`, optional
+        The data folder. Defaults to the one configured in the rc.
+    shared : bool
+        Takes a shared (read) lock if True, and an exclusive one otherwise.
+    blocking : bool
+        If False, yields False instead of waiting for the lock.
+
+    Returns
+    -------
+    object
+        A context manager that yields whether the lock was acquired.
+    """
+    folder = _data_folder(folder)
+    lock_path = os.path.join(
+        folder, LOCKS_FOLDER, _relpath(path, folder) + ".lock"
+    )
+    return file_lock(lock_path, shared=shared, blocking=blocking)
+
+
+def record_access(path, members=None, folder=None):
+    """Records that a file of the data folder was accessed.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cached file.
+    members : :obj:`list`, optional
+        Paths to the files that were extracted from ``path``. They are accounted
+        in the size of the entry and evicted together with it.
+    folder : :obj:`str`, optional
+        The data folder. Defaults to the one configured in the rc.
+    """
+    folder = _data_folder(folder)
+    key = _relpath(path, folder)
+    with _locked_index(folder) as index:
+        entry = index.setdefault(key, {"pinned": False, "members": []})
+        if members is not None:
+            entry["members"] = sorted(
+                set(entry["members"]) | {_relpath(m, folder) for m in members}
+            )
+        entry["atime"] = time.time()
+        entry["size"] = _entry_size(folder, key, entry)
+
+
+def touch(path):
+    """Marks a cached file as used now. Only its access time on the file system
+    is updated: the index is neither locked nor rewritten.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cached file.
+    """
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def _last_access(folder, key, entry):
+    """The last time an entry was recorded or touched."""
+    try:
+        atime = os.stat(os.path.join(folder, key)).st_atime
+    except OSError:
+        atime = 0
+    return max(entry["atime"], atime)
+
+
+def _entry_size(folder, key, entry):
+    size = 0
+    for name in [key] + entry["members"]:
+        try:
+            size += os.path.getsize(os.path.join(folder, name))
+        except OSError:
+            pass
+    return size
+
+
+def pin(path, pinned=True, folder=None):
+    """Pins (or unpins) a cache entry. Pinned entries are never evicted.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cached file.
+    pinned : bool
+        Whether to pin or to unpin the entry.
+    folder : :obj:`str`, optional
+        The data folder. Defaults to the one configured in the rc.
+
+    Raises
+    ------
+    ValueError
+        If ``path`` does not exist.
+    """
+    folder = _data_folder(folder)
+    if not os.path.exists(path):
+        raise ValueError(f"The file `{path}' does not exist.")
+    key = _relpath(path, folder)
+    with _locked_index(folder) as index:
+        entry = index.setdefault(
+            key, {"atime": time.time(), "members": [], "size": 0}
+        )
+        entry["pinned"] = pinned
+        entry["size"] = _entry_size(folder, key, entry)
+
+
+def disk_usage(folder=None):
+    """Reports the entries of the data folder.
+
+    Parameters
+    ----------
+    folder : :obj:`str`, optional
+        The data folder. Defaults to the one configured in the rc.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping the path of each entry (relative to ``folder``) to
+        its ``size`` (in bytes), the ``atime`` at which it was last accessed
+        (see :py:func:`touch`) and whether it is ``pinned``.
+    """
+    folder = _data_folder(folder)
+    index = _load_index(folder)
+    return {
+        key: {
+            "size": _entry_size(folder, key, entry),
+            "atime": _last_access(folder, key, entry),
+            "pinned": entry["pinned"],
+        }
+        for key, entry in index.items()
+        if os.path.exists(os.path.join(folder, key))
+    }
+
+
+def _remove_entry(folder, key, entry):
+    for name in [key] + entry["members"]:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) or os.path.islink(path):
+            os.remove(path)
+    # remove the folders that got empty through the eviction
+    for name in sorted(entry["members"], key=len, reverse=True):
+        path = os.path.dirname(os.path.join(folder, name))
+        while os.path.abspath(path) != os.path.abspath(folder):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
+
+
+def _demote_entry(folder, key, entry, demote_to):
+    destination = os.path.join(demote_to, key)
+    if os.path.exists(destination):
+        return
+    logger.info("Demoting `%s' to `%s'", key, demote_to)
+    members = []
+    for name in [key] + entry["members"]:
+        src = os.path.join(folder, name)
+        if not os.path.isfile(src):
+            continue
+        dst = os.path.join(demote_to, name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.part"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        if name != key:
+            members.append(dst)
+    record_access(destination, members=members, folder=demote_to)
+
+
+def collect_garbage(quota=None, folder=None, dry_run=False, demote_to=None):
+    """Evicts the least recently used entries until the data folder fits in the
+    quota. Pinned entries and entries locked by running processes (see
+    :py:func:`entry_lock`) are skipped.
+
+    Parameters
+    ----------
+    quota : int or str or None
+        The maximum size of the data folder. Defaults to the value of the
+        ``bob_data_quota`` rc key. Nothing is evicted if no quota is set.
+    folder : :obj:`str`, optional
+        The data folder. Defaults to the one configured in the rc.
+    dry_run : bool
+        If True, only reports what would be evicted.
+    demote_to : :obj:`str`, optional
+        If given, the evicted entries are moved into this (slower) folder
+        instead of being deleted, unless it already contains them.
+
+    Returns
+    -------
+    list
+        The paths (relative to ``folder``) of the evicted entries.
+    """
+    folder = _data_folder(folder)
+    quota = parse_size(rc.get(QUOTA_KEY) if quota is None else quota)
+    if quota is None or not os.path.isdir(folder):
+        return []
+
+    evicted = []
+    with _locked_index(folder) as index:
+        # forget about the entries that were removed by hand
+        for key in [
+            k for k in index if not os.path.exists(os.path.join(folder, k))
+        ]:
+            del index[key]
+
+        for key, entry in index.items():
+            entry["size"] = _entry_size(folder, key, entry)
+            entry["atime"] = _last_access(folder, key, entry)
+        total = sum(entry["size"] for entry in index.values())
+
+        for key, entry in sorted(index.items(), key=lambda i: i[1]["atime"]):
+            if total <= quota:
+                break
+            if entry["pinned"]:
+                continue
+            with entry_lock(
+                os.path.join(folder, key),
+                folder=folder,
+                shared=False,
+                blocking=False,
+            ) as acquired:
+                if not acquired:
+                    logger.debug("Skipping `%s' which is in use", key)
+                    continue
+                logger.info(
+                    "Evicting `%s' (%s)", key, format_size(entry["size"])
+                )
+                if not dry_run:
+                    if demote_to is not None:
+                        _demote_entry(folder, key, entry, demote_to)
+                    _remove_entry(folder, key, entry)
+            total -= entry["size"]
+            evicted.append(key)
+
+        if not dry_run:
+            for key in evicted:
+                del index[key]
+
+    if total > quota:
+        logger.warning(
+            "The data folder `%s' uses %s which is still above the quota of "
+            "%s",
+            folder,
+            format_size(total),
+            format_size(quota),
+        )
+    return evicted
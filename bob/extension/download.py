@@ -2,22 +2,40 @@
 # vim: set fileencoding=utf-8 :
 
 import bz2
+import contextlib
+import functools
+import getpass
 import glob
 import hashlib
+import http.client
 import io
+import json
 import logging
 import os
+import socket
+import ssl
 import tarfile
+import tempfile
+import threading
+import time
+import uuid
 import zipfile
 
 from pathlib import Path
-from shutil import copyfileobj
-from urllib.request import urlopen
+from shutil import copyfile, copyfileobj
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlparse
+from urllib.request import getproxies, proxy_bypass, url2pathname, urlopen
 
-from . import rc
+from . import artifacts, data_cache, rc
+from .utils import file_lock
 
 logger = logging.getLogger(__name__)
 
+_CHUNK_SIZE = 64 * 1024
+
+_HOSTNAME = socket.gethostname()
+
 
 def _bob_data_folder():
     return rc.get(
@@ -25,13 +43,113 @@ def _bob_data_folder():
     )
 
 
-def _unzip(zip_file, directory):
+class JSONLinesHook:
+    """A download hook that appends every event as one JSON object per line to
+    a file, for example to profile the staging of artifacts of batch jobs.
+
+    Setting the ``bob_data_metrics`` rc key to a path installs this hook for
+    all downloads. Each line holds the ``event`` name, the ``time``, the
+    ``host`` and the ``pid`` of the process, and the information of the event.
+
+    Parameters
+    ----------
+    path : str
+        The file to append the events to.
+    progress : bool
+        If False (the default), the ``download_progress`` events are skipped.
+    """
+
+    def __init__(self, path, progress=False):
+        self.path = os.path.expanduser(path)
+        self.progress = progress
+        self._lock = threading.Lock()
+
+    def __call__(self, event, info):
+        if event == "download_progress" and not self.progress:
+            return
+        record = dict(
+            info, event=event, time=time.time(), host=_HOSTNAME, pid=os.getpid()
+        )
+        line = json.dumps(record, sort_keys=True) + "\n"
+        # a single write of a line opened in append mode is not interleaved
+        # with the writes of other processes
+        with self._lock, open(self.path, "at") as f:
+            f.write(line)
+
+
+_download_hooks = []
+
+
+def add_download_hook(hook):
+    """Registers a hook that is called with the events emitted while files are
+    downloaded, validated and extracted.
+
+    The hook is called as ``hook(event, info)`` where ``info`` is a dictionary.
+    The events and the keys of their ``info`` are:
+
+    * ``download_start``: ``url``, ``path``, ``total`` (the size in bytes, or
+      None if unknown).
+    * ``download_progress``: ``url``, ``path``, ``bytes`` (received so far),
+      ``total``, ``elapsed`` (in seconds).
+    * ``download_end``: ``url``, ``path``, ``bytes``, ``elapsed``.
+    * ``hash``: ``path``, ``algorithm``, ``bytes``, ``elapsed``.
+    * ``extract_member``: ``archive``, ``member``, ``bytes``, ``elapsed``.
+    * ``get_file``: ``filename``, ``path``, ``downloaded``, ``elapsed``.
+
+    Parameters
+    ----------
+    hook : callable
+        The hook to register.
+    """
+    _download_hooks.append(hook)
+
+
+def remove_download_hook(hook):
+    """Unregisters a hook registered with :py:func:`add_download_hook`."""
+    _download_hooks.remove(hook)
+
+
+@functools.lru_cache(maxsize=None)
+def _metrics_hook(path):
+    return JSONLinesHook(path)
+
+
+def _hooks():
+    """Returns the hooks to call for the next events."""
+    path = rc.get("bob_data_metrics")
+    if path is None:
+        return list(_download_hooks)
+    return _download_hooks + [_metrics_hook(path)]
+
+
+def _emit(hooks, event, **info):
+    for hook in hooks:
+        try:
+            hook(event, info)
+        except Exception:
+            logger.warning("The download hook %s failed", hook, exc_info=True)
+
+
+def _unzip(zip_file, directory, hooks=()):
 
     with zipfile.ZipFile(zip_file) as myzip:
-        myzip.extractall(directory)
+        if not hooks:
+            myzip.extractall(directory)
+        for info in myzip.infolist() if hooks else ():
+            start = time.monotonic()
+            myzip.extract(info, directory)
+            _emit(
+                hooks,
+                "extract_member",
+                archive=zip_file,
+                member=info.filename,
+                bytes=info.file_size,
+                elapsed=time.monotonic() - start,
+            )
+        return [os.path.join(directory, name) for name in myzip.namelist()]
 
 
-def _untar(tar_file, directory, ext):
+def _untar(tar_file, directory, ext, hooks=()):
 
     if ext in [".bz2" or ".tbz2"]:
         mode = "r:bz2"
@@ -41,13 +159,37 @@ def _untar(tar_file, directory, ext):
         mode = "r"
 
     with tarfile.open(name=tar_file, mode=mode) as t:
-        t.extractall(directory)
+        if not hooks:
+            t.extractall(directory)
+        for member in t if hooks else ():
+            start = time.monotonic()
+            t.extract(member, directory)
+            _emit(
+                hooks,
+                "extract_member",
+                archive=tar_file,
+                member=member.name,
+                bytes=member.size,
+                elapsed=time.monotonic() - start,
+            )
+        return [os.path.join(directory, name) for name in t.getnames()]
 
 
-def _unbz2(bz2_file):
+def _unbz2(bz2_file, hooks=()):
 
+    start = time.monotonic()
+    out_file = os.path.splitext(bz2_file)[0]
     with bz2.BZ2File(bz2_file) as t:
-        open(os.path.splitext(bz2_file)[0], "wb").write(t.read())
+        open(out_file, "wb").write(t.read())
+    _emit(
+        hooks,
+        "extract_member",
+        archive=bz2_file,
+        member=os.path.basename(out_file),
+        bytes=os.path.getsize(out_file),
+        elapsed=time.monotonic() - start,
+    )
+    return [out_file]
 
 
 def extract_compressed_file(filename):
@@ -58,6 +200,11 @@ def extract_compressed_file(filename):
     filename : str
         Path to the .zip, .tar, .tar.*, .tgz, .tbz2, and .bz2 file
 
+    Returns
+    -------
+    list
+        The paths to the extracted files and folders.
+
     Raises
     ------
     ValueError
@@ -66,25 +213,426 @@ def extract_compressed_file(filename):
     # Uncompressing if it is the case
     header, ext = os.path.splitext(filename)
     header, ext = header.lower(), ext.lower()
+    hooks = _hooks()
     if ext == ".zip":
         logger.info("Unziping in {0}".format(filename))
-        _unzip(filename, os.path.dirname(filename))
+        return _unzip(filename, os.path.dirname(filename), hooks)
 
     elif header[-4:] == ".tar" or ext in [".tar", ".tgz", ".tbz2"]:
         logger.info("Untar/gzip in {0}".format(filename))
-        _untar(filename, os.path.dirname(filename), ext)
+        return _untar(filename, os.path.dirname(filename), ext, hooks)
 
     elif ext == ".bz2":
         logger.info("Unbz2 in {0}".format(filename))
-        _unbz2(filename)
+        return _unbz2(filename, hooks)
 
     else:
         raise ValueError(f"Unknown compressed file: {filename}")
 
 
+def _download_lock_folder():
+    """The folder holding the files that coordinate the downloads of all the
+    processes of the host."""
+    folder = rc.get("bob_data_download_lockdir")
+    if folder is None:
+        folder = os.path.join(
+            tempfile.gettempdir(), f"bob_downloads_{getpass.getuser()}"
+        )
+    return os.path.expanduser(folder)
+
+
+@contextlib.contextmanager
+def _connection_slot():
+    """Waits until less than ``bob_data_download_connections`` downloads are
+    running on the host. Each running download holds the lock of one slot."""
+    connections = rc.get("bob_data_download_connections")
+    if connections is None or int(connections) <= 0:
+        yield
+        return
+    connections = int(connections)
+    folder = _download_lock_folder()
+    delay = 0.01
+    while True:
+        for i in range(connections):
+            path = os.path.join(folder, f"connection-{i}.lock")
+            with file_lock(path, blocking=False) as acquired:
+                if acquired:
+                    yield
+                    return
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def _throttle(nbytes, rate):
+    """Waits until ``nbytes`` can be transferred without exceeding ``rate``
+    bytes per second on the host.
+
+    This is a token bucket shared by all processes through a state file. The
+    bucket holds at most one second worth of tokens and may go in debt, in which
+    case the caller sleeps until the debt is paid back.
+    """
+    folder = _download_lock_folder()
+    state = os.path.join(folder, "rate.state")
+    with file_lock(os.path.join(folder, "rate.lock")):
+        now = time.monotonic()
+        try:
+            with open(state, "rt") as f:
+                tokens, last = (float(v) for v in f.read().split())
+        except (OSError, ValueError):
+            tokens, last = 0.0, now
+        # the monotonic clock is shared by all processes, but the state file
+        # may outlive a reboot
+        elapsed = max(now - last, 0.0)
+        tokens = min(float(rate), tokens + elapsed * rate) - nbytes
+        with open(state, "wt") as f:
+            f.write(f"{tokens} {now}")
+    if tokens < 0:
+        time.sleep(-tokens / rate)
+
+
+class Transport:
+    """The interface of the transports that :py:func:`download_file` uses to
+    fetch urls. See :py:func:`register_transport`."""
+
+    def open(self, url):
+        """Opens an url for reading.
+
+        Parameters
+        ----------
+        url : str
+            The url to open.
+
+        Returns
+        -------
+        object
+            A binary file-like object (that can be used as a context manager)
+            with the content of ``url``.
+
+        Raises
+        ------
+        OSError
+            If ``url`` cannot be opened.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the resources (e.g. connections) held by the transport."""
+        pass
+
+
+class URLLibTransport(Transport):
+    """Opens urls with :py:func:`urllib.request.urlopen`. This is used for the
+    url schemes that have no dedicated transport and for the urls that need to
+    go through a proxy."""
+
+    def open(self, url):
+        return urlopen(url, timeout=_rc_float("bob_data_download_timeout", 60))
+
+
+class FileTransport(Transport):
+    """Opens ``file://`` urls."""
+
+    def open(self, url):
+        return open(url2pathname(urlparse(url).path), "rb")
+
+
+class LocalDirectoryTransport(Transport):
+    """Serves urls from a local directory (e.g. a mirror or a test fixture).
+
+    The url ``https://host/some/path/file.zip`` is looked up in
+    ``<root>/host/some/path/file.zip`` and then in ``<root>/file.zip``.
+
+    Parameters
+    ----------
+    root : str
+        The local directory containing the files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, url):
+        parsed = urlparse(url)
+        relative = url2pathname(parsed.path).lstrip(os.sep)
+        for path in (
+            os.path.join(self.root, parsed.netloc, relative),
+            os.path.join(self.root, os.path.basename(relative)),
+        ):
+            if os.path.isfile(path):
+                return open(path, "rb")
+        raise FileNotFoundError(f"The url `{url}' is not in `{self.root}'")
+
+
+class _PooledResponse(io.RawIOBase):
+    """A response that gives its connection back to the pool once it was
+    completely read."""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+        self.length = response.length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._response.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._release(self._response)
+        super().close()
+
+
+# the errors of a pooled connection that the server closed while it was idle
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class HTTPTransport(Transport):
+    """Fetches ``http://`` and ``https://`` urls through keep-alive connections
+    that are reused by the following downloads from the same host. Connections
+    are pooled per thread.
+
+    A pooled connection that the server closed while it was idle is replaced at
+    once by a new one. Other failing connections and server errors (5xx and
+    429) are retried with an exponential backoff. The arguments default to the values of the
+    ``bob_data_download_timeout`` (in seconds, 60 by default),
+    ``bob_data_download_retries`` (3 by default) and
+    ``bob_data_download_backoff`` (in seconds, 0.5 by default) rc keys.
+
+    Parameters
+    ----------
+    timeout : :obj:`float`, optional
+        The timeout of the socket operations.
+    retries : :obj:`int`, optional
+        The number of times a failing request is retried.
+    backoff : :obj:`float`, optional
+        The delay before the first retry, doubled on each retry.
+    """
+
+    max_redirects = 10
+
+    def __init__(self, timeout=None, retries=None, backoff=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._local = threading.local()
+
+    def _pool(self):
+        if not hasattr(self._local, "pool"):
+            self._local.pool = {}
+        return self._local.pool
+
+    def _connection(self, scheme, netloc, timeout, pooled=True):
+        if pooled:
+            connection = self._pool().pop((scheme, netloc), None)
+            if connection is not None:
+                return connection, True
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                netloc, timeout=timeout, context=ssl.create_default_context()
+            )
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=timeout)
+        return connection, False
+
+    def _release(self, key, connection, response):
+        if response.isclosed() and not response.will_close:
+            old = self._pool().pop(key, None)
+            if old is not None:
+                old.close()
+            self._pool()[key] = connection
+        else:
+            connection.close()
+
+    def _request(self, url, timeout):
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        pooled = True
+        while True:
+            connection, pooled = self._connection(*key, timeout, pooled)
+            try:
+                connection.request(
+                    "GET", path, headers={"User-Agent": "bob.extension"}
+                )
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not pooled:
+                    raise
+                # the server closed the idle connection: this is not a failure
+                # of the request, so reconnect at once
+                logger.debug(
+                    "The pooled connection to %s was closed, reconnecting",
+                    parsed.netloc,
+                )
+                pooled = False
+                continue
+            except BaseException:
+                connection.close()
+                raise
+            break
+        if response.status >= 300:
+            # drain the body to be able to reuse the connection
+            response.read()
+            self._release(key, connection, response)
+        else:
+            response = _PooledResponse(
+                response, functools.partial(self._release, key, connection)
+            )
+        return response
+
+    def open(self, url):
+        timeout = self.timeout
+        if timeout is None:
+            timeout = _rc_float("bob_data_download_timeout", 60)
+        retries = self.retries
+        if retries is None:
+            retries = int(_rc_float("bob_data_download_retries", 3))
+        backoff = self.backoff
+        if backoff is None:
+            backoff = _rc_float("bob_data_download_backoff", 0.5)
+
+        attempt = 0
+        redirects = 0
+        while True:
+            try:
+                response = self._request(url, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+            else:
+                if isinstance(response, _PooledResponse):
+                    return response
+                if response.status in (301, 302, 303, 307, 308):
+                    redirects += 1
+                    if redirects > self.max_redirects:
+                        raise HTTPError(
+                            url, response.status, "Too many redirects", {}, None
+                        )
+                    url = urljoin(url, response.getheader("Location"))
+                    continue
+                error = HTTPError(
+                    url,
+                    response.status,
+                    response.reason,
+                    response.headers,
+                    None,
+                )
+                if response.status < 500 and response.status != 429:
+                    raise error
+            if attempt >= retries:
+                raise error
+            delay = backoff * 2**attempt
+            attempt += 1
+            logger.debug(
+                "Retrying %s in %.1fs after: %s",
+                url,
+                delay,
+                error,
+                exc_info=True,
+            )
+            time.sleep(delay)
+
+    def close(self):
+        pool = self._pool()
+        for connection in pool.values():
+            connection.close()
+        pool.clear()
+
+
+_transports = {
+    "http": HTTPTransport(),
+    "https": HTTPTransport(),
+    "file": FileTransport(),
+}
+_default_transport = URLLibTransport()
+
+
+def register_transport(scheme, transport):
+    """Registers the transport used to download the urls of a scheme.
+
+    Example
+    -------
+    To serve all ``https://`` urls from a local mirror::
+
+        register_transport("https", LocalDirectoryTransport("/mirror"))
+
+    Parameters
+    ----------
+    scheme : str
+        The url scheme, e.g. ``"https"``.
+    transport : :py:class:`Transport`
+        The transport to use for this scheme.
+
+    Returns
+    -------
+    :py:class:`Transport` or None
+        The transport that was previously registered for this scheme.
+    """
+    old = _transports.get(scheme)
+    _transports[scheme] = transport
+    return old
+
+
+def get_transport(url):
+    """Returns the transport that :py:func:`download_file` uses for an url.
+
+    Parameters
+    ----------
+    url : str
+        The url to download.
+
+    Returns
+    -------
+    :py:class:`Transport`
+        The transport registered for the scheme of ``url``. The urls that must
+        go through a proxy (see :py:func:`urllib.request.getproxies`) are
+        always opened with :py:func:`urllib.request.urlopen`.
+    """
+    parsed = urlparse(url)
+    transport = _transports.get(parsed.scheme, _default_transport)
+    if isinstance(transport, HTTPTransport):
+        if parsed.scheme in getproxies() and not proxy_bypass(
+            parsed.hostname or ""
+        ):
+            return _default_transport
+    return transport
+
+
+def _open_url(url):
+    mirror = rc.get("bob_data_mirror")
+    if mirror is not None:
+        try:
+            return LocalDirectoryTransport(os.path.expanduser(mirror)).open(url)
+        except FileNotFoundError:
+            logger.debug("The url %s was not found in the mirror", url)
+    return get_transport(url).open(url)
+
+
 def download_file(url, out_file):
     """Downloads a file from a given url
 
+    The downloads of all processes of the host can be throttled by setting the
+    ``bob_data_download_rate`` rc key (in bytes per second, e.g. ``10M``) and
+    the number of simultaneous downloads limited with the
+    ``bob_data_download_connections`` rc key (0 means no limit for both). The
+    processes coordinate through lock files in the folder given by the
+    ``bob_data_download_lockdir`` rc key (by default, a folder of the user in
+    the temporary directory); point it to a folder writable by all users to
+    share the limits between users.
+
+    The url is opened with the :py:class:`Transport` registered for its scheme
+    (see :py:func:`get_transport`). If the ``bob_data_mirror`` rc key points to
+    a local directory, the file is first looked up there (see
+    :py:class:`LocalDirectoryTransport`).
+
     Parameters
     ----------
     url : str
@@ -93,9 +641,53 @@ def download_file(url, out_file):
     out_file : str
         Where to save the file.
     """
-    with urlopen(url) as response:
+    rate = data_cache.parse_size(rc.get("bob_data_download_rate"))
+    if rate is not None and rate <= 0:
+        rate = None
+    hooks = _hooks()
+    with _connection_slot(), _open_url(url) as response:
+        start = time.monotonic()
+        received = 0
+        total = _content_length(response)
+        _emit(hooks, "download_start", url=url, path=out_file, total=total)
         with open(out_file, "wb") as f:
-            copyfileobj(response, f)
+            if rate is None and not hooks:
+                copyfileobj(response, f)
+            else:
+                for chunk in iter(lambda: response.read(_CHUNK_SIZE), b""):
+                    if rate is not None:
+                        _throttle(len(chunk), rate)
+                    f.write(chunk)
+                    received += len(chunk)
+                    _emit(
+                        hooks,
+                        "download_progress",
+                        url=url,
+                        path=out_file,
+                        bytes=received,
+                        total=total,
+                        elapsed=time.monotonic() - start,
+                    )
+    if hooks:
+        _emit(
+            hooks,
+            "download_end",
+            url=url,
+            path=out_file,
+            bytes=received,
+            elapsed=time.monotonic() - start,
+        )
+
+
+def _content_length(response):
+    """Returns the size of an opened url, or None if it is unknown."""
+    length = getattr(response, "length", None)
+    if length is not None:
+        return length
+    try:
+        return os.fstat(response.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
 
 
 def download_file_from_possible_urls(urls, out_file):
@@ -200,13 +792,97 @@ def _hash_file(fpath, algorithm="sha256", chunk_size=65535):
     else:
         hasher = hashlib.md5()
 
+    start = time.monotonic()
     with open(fpath, "rb") as fpath_file:
         for chunk in iter(lambda: fpath_file.read(chunk_size), b""):
             hasher.update(chunk)
 
+    _emit(
+        _hooks(),
+        "hash",
+        path=fpath,
+        algorithm=hasher.name,
+        bytes=os.path.getsize(fpath),
+        elapsed=time.monotonic() - start,
+    )
     return str(hasher.hexdigest())
 
 
+def _rc_float(key, default):
+    value = rc.get(key)
+    return default if value is None else float(value)
+
+
+def _rc_flag(key, default):
+    value = rc.get(key)
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _bob_data_folders():
+    """Returns the cache tiers, fastest first. The last tier is always the
+    ``bob_data_folder``."""
+    tiers = rc.get("bob_data_tiers") or []
+    if isinstance(tiers, str):
+        tiers = [t for t in tiers.split(os.pathsep) if t]
+    return [os.path.expanduser(t) for t in tiers] + [_bob_data_folder()]
+
+
+def _atomic_copy(src, dst):
+    """Copies ``src`` to ``dst`` so that ``dst`` is never seen half-written."""
+    tmp = f"{dst}.{os.getpid()}.part"
+    try:
+        copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _atomic_download(urls, out_file, file_hash, hash_algorithm):
+    """Yields a request to download ``urls`` into a temporary file, which is
+    moved to ``out_file`` only once it is complete and valid. See
+    :py:func:`_get_file_steps`."""
+    tmp = f"{out_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        yield urls, tmp
+        if file_hash is not None and not validate_file(
+            tmp, file_hash, algorithm=hash_algorithm
+        ):
+            found_hash = _hash_file(tmp, algorithm=hash_algorithm)
+            raise ValueError(
+                f"The downloaded file: {out_file} has the hash of {found_hash}, but we expected {file_hash}. Please re-do the procedure."
+            )
+        os.replace(tmp, out_file)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _quota(folders, i):
+    """The quota of the i-th cache tier."""
+    if i == len(folders) - 1:
+        return rc.get(data_cache.QUOTA_KEY)
+    return rc.get("bob_data_tiers_quota")
+
+
+def _collect_garbage(folders):
+    """Enforces the quotas of all cache tiers."""
+    demote = _rc_flag("bob_data_tiers_demote", False)
+    for i, folder in enumerate(folders):
+        quota = _quota(folders, i)
+        demote_to = None
+        if i < len(folders) - 1 and demote:
+            demote_to = folders[i + 1]
+        if quota is not None:
+            data_cache.collect_garbage(
+                quota=quota, folder=folder, demote_to=demote_to
+            )
+
+
 def get_file(
     filename,
     urls,
@@ -223,6 +899,40 @@ def get_file(
 
         $ bob config set bob_data_folder /another/location/
 
+    Every download is recorded in the index of
+    :py:mod:`bob.extension.data_cache` and, if a ``bob_data_quota`` is
+    configured, the cache hits are recorded too and the least recently used
+    files are evicted after each download.
+
+    When ``bob_data_folder`` lives on a shared file system, faster node-local
+    folders can be placed in front of it (fastest first, separated by ``:``)::
+
+        $ bob config set bob_data_tiers /tmp/bob_data:/ssd/bob_data
+
+    Files are then looked up in each tier in order, and downloaded only if no
+    tier has them. The behavior of the tiers is controlled by these rc keys:
+
+    * ``bob_data_tiers_promote`` (default: true): copy the files found in (or
+      downloaded into) a slower tier into the fastest one.
+    * ``bob_data_tiers_download`` (default: ``shared``): download into the
+      ``bob_data_folder`` (``shared``) so other nodes benefit from it, or only
+      into the fastest tier (``local``).
+    * ``bob_data_tiers_quota``: the quota of each of the faster tiers.
+    * ``bob_data_tiers_demote`` (default: false): move the files evicted from
+      a faster tier into the next one, instead of deleting them, if they are
+      not there yet.
+
+    The progress of the download, the validation and the extraction can be
+    followed through :py:func:`add_download_hook`.
+
+    All tiers are populated atomically: a file is only visible once it was
+    completely written (and validated against ``file_hash``).
+
+    If a manifest written by ``bob data prefetch`` is configured (see
+    :py:mod:`bob.extension.artifacts`), the cached files are checked against it
+    and, when ``bob_data_offline`` is set, a missing file raises an error
+    instead of being downloaded.
+
     Parameters
     ----------
     filename : str
@@ -253,21 +963,74 @@ def get_file(
     ------
     ValueError
         If the file_hash does not match the downloaded file
+    RuntimeError
+        If the file is not cached and ``bob_data_offline`` is set.
     """
-    cache_dir = _bob_data_folder()
-
-    cache_dir = os.path.join(cache_dir, cache_subdir)
-    os.makedirs(cache_dir, exist_ok=True)
+    return _run_steps(
+        _get_file_steps(
+            filename,
+            urls,
+            cache_subdir,
+            file_hash,
+            hash_algorithm,
+            extract,
+            force,
+        )
+    )
 
-    final_filename = os.path.join(cache_dir, filename)
 
-    download = True
-    if os.path.exists(final_filename):
-        if file_hash is None or validate_file(
-            final_filename, file_hash, algorithm=hash_algorithm
-        ):
-            download = False
-        else:
+def _run_steps(steps):
+    """Runs the steps of :py:func:`get_file`, downloading synchronously."""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                download_file_from_possible_urls(*request)
+            except BaseException:
+                # cleans up the temporary file and releases the locks
+                steps.close()
+                raise
+            request = steps.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def _get_file_steps(
+    filename, urls, cache_subdir, file_hash, hash_algorithm, extract, force
+):
+    """Implements :py:func:`get_file` as a generator that yields a
+    ``(urls, out_file)`` request each time a file must be downloaded, and
+    returns the path to the file. This lets the synchronous and the asynchronous
+    (see :py:mod:`bob.extension.download_async`) versions share everything but
+    the network I/O."""
+    start = time.monotonic()
+    folders = _bob_data_folders()
+    paths = [os.path.join(f, cache_subdir, filename) for f in folders]
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    promote = _rc_flag("bob_data_tiers_promote", True)
+    local_download = rc.get("bob_data_tiers_download") == "local"
+
+    # the exclusive lock prevents the file from being evicted by another
+    # process while it is being downloaded or extracted.
+    with data_cache.entry_lock(paths[0], folder=folders[0], shared=False):
+        found = None
+        for i, path in enumerate(paths):
+            if force or not os.path.exists(path):
+                continue
+            if not artifacts.check_manifest(path, filename, cache_subdir):
+                logger.warning(
+                    "The file %s does not match the size recorded in the "
+                    "manifest of prefetched files.",
+                    path,
+                )
+                continue
+            if file_hash is None or validate_file(
+                path, file_hash, algorithm=hash_algorithm
+            ):
+                found = i
+                break
             logger.warning(
                 f"A file was found, but it seems to be "
                 f"corrupted or outdated because its "
@@ -275,24 +1038,58 @@ def get_file(
                 f" so, will be re-download."
             )
 
-    if download or force:
-        logger.info("Downloading %s", final_filename)
-        download_file_from_possible_urls(urls, final_filename)
-
-        if file_hash is not None and not validate_file(
-            final_filename, file_hash, algorithm=hash_algorithm
-        ):
-            found_hash = _hash_file(final_filename, algorithm=hash_algorithm)
-            raise ValueError(
-                f"The downloaded file: {final_filename} has the hash of {found_hash}, but we expected {file_hash}. Please re-do the procedure."
+        downloaded = populated = found is None
+        if populated and _rc_flag("bob_data_offline", False):
+            raise RuntimeError(
+                f"The file {paths[-1]} is not available and bob_data_offline "
+                f"is set. Please run `bob data prefetch' on a machine with "
+                f"network access."
             )
-
-    # Finally extract if wanted. This will always extract over what would already exist
-    # so that if a new version of the archive is downloaded, the extracted folder is
-    # updated.
-    if extract:
-        extract_compressed_file(final_filename)
-
+        if populated:
+            found = 0 if local_download else len(paths) - 1
+            logger.info("Downloading %s", paths[found])
+            yield from _atomic_download(
+                urls, paths[found], file_hash, hash_algorithm
+            )
+            if found != 0:
+                data_cache.record_access(paths[found], folder=folders[found])
+
+        if found != 0 and promote:
+            logger.debug("Promoting %s to %s", paths[found], paths[0])
+            _atomic_copy(paths[found], paths[0])
+            found = 0
+            populated = True
+        final_filename = paths[found]
+
+        # Finally extract if wanted. This will always extract over what would
+        # already exist so that if a new version of the archive is downloaded,
+        # the extracted folder is updated.
+        members = None
+        if extract:
+            members = [
+                m
+                for m in extract_compressed_file(final_filename)
+                if os.path.isfile(m)
+            ]
+
+        if populated or members:
+            data_cache.record_access(
+                final_filename, members=members, folder=folders[found]
+            )
+        if populated:
+            _collect_garbage(folders)
+        elif _quota(folders, found) is not None:
+            # cache hits only matter to the eviction of the entries
+            data_cache.touch(final_filename)
+
+    _emit(
+        _hooks(),
+        "get_file",
+        filename=filename,
+        path=final_filename,
+        downloaded=downloaded,
+        elapsed=time.monotonic() - start,
+    )
     return final_filename
 
 
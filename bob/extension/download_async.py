@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""Asynchronous (:py:mod:`asyncio`) counterparts of the functions of
+:py:mod:`bob.extension.download`.
+
+``http://`` and ``https://`` urls are fetched with non-blocking sockets on the
+running event loop, while the file system operations (writing, hashing,
+extraction and the bookkeeping of the data folder) run in the default executor.
+This allows many files to be downloaded concurrently from one event loop::
+
+    paths = await asyncio.gather(
+        aget_file("a.tar.gz", urls_a, extract=True),
+        aget_file("b.tar.gz", urls_b, extract=True),
+    )
+
+Cancelling a task removes the partially downloaded files.
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+import time
+import weakref
+
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlparse
+
+from . import data_cache, download, rc
+from .rc_config import with_rc_context
+
+logger = logging.getLogger(__name__)
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+
+def _run_in_executor(func, *args):
+    # run_in_executor does not propagate the rc_context overrides
+    return asyncio.get_running_loop().run_in_executor(
+        None, with_rc_context(func), *args
+    )
+
+
+# the steps of get_file hold the lock of an entry in an executor thread while
+# the download itself needs other executor threads. The tasks that fetch the
+# same file therefore wait here, instead of blocking threads on the file lock.
+_entry_locks = weakref.WeakValueDictionary()
+
+
+def _entry_lock(filename, cache_subdir):
+    path = os.path.join(download._bob_data_folders()[0], cache_subdir, filename)
+    key = (asyncio.get_running_loop(), os.path.abspath(path))
+    lock = _entry_locks.get(key)
+    if lock is None:
+        lock = _entry_locks[key] = asyncio.Lock()
+    return lock
+
+
+def _uses_event_loop(url):
+    """Whether an url is fetched on the event loop or in the executor."""
+    if rc.get("bob_data_mirror") is not None:
+        return False
+    # get_transport takes care of the urls that need a proxy
+    return isinstance(download.get_transport(url), download.HTTPTransport)
+
+
+async def _read_headers(reader, timeout):
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    parts = status_line.decode("latin-1").split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ConnectionError(f"Invalid HTTP status line: {status_line!r}")
+    status = int(parts[1])
+    reason = parts[2].strip() if len(parts) > 2 else ""
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, reason, headers
+
+
+async def _request(url, timeout):
+    """Sends a GET request and returns the reader, the writer and the headers
+    of the response, following redirects."""
+    for _ in range(download.HTTPTransport.max_redirects + 1):
+        parsed = urlparse(url)
+        https = parsed.scheme == "https"
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parsed.hostname,
+                parsed.port or (443 if https else 80),
+                ssl=ssl.create_default_context() if https else None,
+            ),
+            timeout,
+        )
+        try:
+            path = parsed.path or "/"
+            if parsed.query:
+                path += "?" + parsed.query
+            writer.write(
+                (
+                    f"GET {path} HTTP/1.1\r\n"
+                    f"Host: {parsed.netloc}\r\n"
+                    "User-Agent: bob.extension\r\n"
+                    "Accept-Encoding: identity\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("latin-1")
+            )
+            await asyncio.wait_for(writer.drain(), timeout)
+            status, reason, headers = await _read_headers(reader, timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if status < 300:
+            return reader, writer, headers
+        writer.close()
+        if status in _REDIRECTS and "location" in headers:
+            url = urljoin(url, headers["location"])
+            continue
+        raise HTTPError(url, status, reason, headers, None)
+    raise HTTPError(url, status, "Too many redirects", headers, None)
+
+
+async def _iter_body(reader, headers, timeout):
+    """Yields the chunks of the body of a response."""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            size = int(line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # skip the trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            yield await asyncio.wait_for(reader.readexactly(size), timeout)
+            await reader.readexactly(2)
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            chunk = await asyncio.wait_for(
+                reader.read(min(remaining, download._CHUNK_SIZE)), timeout
+            )
+            if not chunk:
+                raise ConnectionError(
+                    f"The connection was closed with {remaining} bytes left"
+                )
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await asyncio.wait_for(
+                reader.read(download._CHUNK_SIZE), timeout
+            )
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _open_http(url, timeout, retries, backoff):
+    attempt = 0
+    while True:
+        try:
+            return await _request(url, timeout)
+        except HTTPError as e:
+            if e.code < 500 and e.code != 429:
+                raise
+            error = e
+        except (OSError, asyncio.TimeoutError) as e:
+            error = e
+        if attempt >= retries:
+            raise error
+        delay = backoff * 2**attempt
+        attempt += 1
+        logger.debug("Retrying %s in %.1fs after: %s", url, delay, error)
+        await asyncio.sleep(delay)
+
+
+async def adownload_file(url, out_file):
+    """Downloads a file from a given url. This is the asynchronous version of
+    :py:func:`bob.extension.download.download_file`.
+
+    The ``bob_data_download_rate`` limit is honored, but not the
+    ``bob_data_download_connections`` one. Urls that are not ``http://`` or
+    ``https://`` (or that go through a proxy or a mirror) are downloaded by
+    :py:func:`bob.extension.download.download_file` in the default executor.
+
+    Parameters
+    ----------
+    url : str
+        The url to download form.
+    out_file : str
+        Where to save the file. It is removed if the download fails or is
+        cancelled.
+    """
+    if not _uses_event_loop(url):
+        future = _run_in_executor(download.download_file, url, out_file)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the thread cannot be interrupted; wait for it before cleaning up
+            await asyncio.wait([future])
+            _remove(out_file)
+            raise
+        return
+
+    timeout = download._rc_float("bob_data_download_timeout", 60)
+    retries = int(download._rc_float("bob_data_download_retries", 3))
+    backoff = download._rc_float("bob_data_download_backoff", 0.5)
+    rate = data_cache.parse_size(rc.get("bob_data_download_rate"))
+    hooks = download._hooks()
+
+    reader, writer, headers = await _open_http(url, timeout, retries, backoff)
+    start = time.monotonic()
+    received = 0
+    total = headers.get("content-length")
+    total = None if total is None else int(total)
+    download._emit(hooks, "download_start", url=url, path=out_file, total=total)
+    f = await _run_in_executor(open, out_file, "wb")
+    try:
+        async for chunk in _iter_body(reader, headers, timeout):
+            if rate is not None:
+                await _run_in_executor(download._throttle, len(chunk), rate)
+            await _run_in_executor(f.write, chunk)
+            received += len(chunk)
+            download._emit(
+                hooks,
+                "download_progress",
+                url=url,
+                path=out_file,
+                bytes=received,
+                total=total,
+                elapsed=time.monotonic() - start,
+            )
+    except BaseException:
+        f.close()
+        _remove(out_file)
+        raise
+    finally:
+        writer.close()
+    await _run_in_executor(f.close)
+    download._emit(
+        hooks,
+        "download_end",
+        url=url,
+        path=out_file,
+        bytes=received,
+        elapsed=time.monotonic() - start,
+    )
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def adownload_file_from_possible_urls(urls, out_file):
+    """Tries to download a file from a list of possible urls. This is the
+    asynchronous version of
+    :py:func:`bob.extension.download.download_file_from_possible_urls`.
+
+    Parameters
+    ----------
+    urls : list
+        List of urls
+    out_file : str
+        Path to save the file
+
+    Raises
+    ------
+    RuntimeError
+        If downloading from all urls fails.
+    """
+    for url in urls:
+        try:
+            await adownload_file(url, out_file)
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning(
+                "Could not download from the %s url", url, exc_info=True
+            )
+    else:  # else is for the for loop
+        raise RuntimeError(
+            f"Could not download the requested file from the following urls: {urls}"
+        )
+
+
+def _advance(steps):
+    try:
+        return False, next(steps)
+    except StopIteration as e:
+        return True, e.value
+
+
+async def aget_file(
+    filename,
+    urls,
+    cache_subdir="datasets",
+    file_hash=None,
+    hash_algorithm="auto",
+    extract=False,
+    force=False,
+):
+    """Downloads a file from a given a list of URLS. This is the asynchronous
+    version of :py:func:`bob.extension.download.get_file`, which takes the
+    same parameters and behaves the same way.
+
+    The calls for the same file wait for each other on the event loop, so that
+    they do not exhaust the threads of the default executor.
+
+    Returns
+    -------
+    str
+        The path to the downloaded file.
+    """
+    async with _entry_lock(filename, cache_subdir):
+        steps = download._get_file_steps(
+            filename,
+            urls,
+            cache_subdir,
+            file_hash,
+            hash_algorithm,
+            extract,
+            force,
+        )
+        step = None
+        try:
+            while True:
+                # looking up, hashing and extracting files is blocking
+                step = _run_in_executor(_advance, steps)
+                done, result = await asyncio.shield(step)
+                step = None
+                if done:
+                    return result
+                await adownload_file_from_possible_urls(*result)
+        except BaseException:
+            if step is not None:
+                # the generator cannot be closed while it runs in the executor
+                await asyncio.wait([step])
+            # removes the temporary files and releases the locks
+            steps.close()
+            raise
@@ -5,8 +5,20 @@
 """Sets-up logging, centrally for Bob.
 """
 
+import atexit
+import copy
 import logging
+import logging.handlers
+import os
+import pickle
+import queue
+import shutil
+import socketserver
+import struct
 import sys
+import tempfile
+import threading
+import time
 
 # get the default root logger of Bob
 _logger = logging.getLogger("bob")
@@ -30,9 +42,499 @@ _debug_info.addFilter(_InfoFilter())
 _logger.addHandler(_debug_info)
 
 
+class _SuppressingFilter(logging.Filter):
+    """Base of the filters that suppress records by (logger, message
+    template). The number of suppressed records is appended to the next record
+    of the same template that passes. When no such record comes, a summary is
+    written once the template could pass again, or by :py:func:`flush` and at
+    exit. The records whose message is not a string (e.g. an array) have no
+    template and always pass."""
+
+    _clock = staticmethod(time.monotonic)
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._state = {}
+        # the last suppressed record of each template
+        self._pending = {}
+        self._last_sweep = None
+
+    def _allow(self, state, now):
+        """Returns whether a record passes and updates ``state`` (a list
+        initialized by :py:meth:`_new_state`) accordingly."""
+        raise NotImplementedError
+
+    def _may_pass(self, state, now):
+        """Returns whether a record would pass now, without updating
+        ``state``."""
+        raise NotImplementedError
+
+    def _new_state(self, now):
+        raise NotImplementedError
+
+    def filter(self, record):
+        if not isinstance(record.msg, str):
+            return True
+        key = (record.name, record.msg)
+        now = self._clock()
+        with self._lock:
+            expired = self._sweep(now, skip=key)
+            state = self._state.get(key)
+            if state is None:
+                self._state[key] = self._new_state(now)
+                suppressed = 0
+            elif not self._allow(state, now):
+                state[-1] += 1
+                self._pending[key] = record
+                suppressed = None
+            else:
+                suppressed, state[-1] = state[-1], 0
+                self._pending.pop(key, None)
+        _emit_summaries(expired)
+        if suppressed is None:
+            return False
+        if suppressed:
+            record.msg = "%s (%d similar messages were suppressed)" % (
+                record.msg,
+                suppressed,
+            )
+        return True
+
+    def _sweep(self, now, everything=False, skip=None):
+        """Returns the summaries of the templates that stopped recurring (at
+        most once per second, unless ``everything`` is summarized)."""
+        if (
+            not everything
+            and self._last_sweep is not None
+            and now - self._last_sweep < 1
+        ):
+            return []
+        self._last_sweep = now
+        summaries = []
+        for key, record in list(self._pending.items()):
+            if key == skip:
+                continue
+            state = self._state[key]
+            if everything or self._may_pass(state, now):
+                summaries.append((record, state[-1]))
+                state[-1] = 0
+                del self._pending[key]
+        return summaries
+
+    def flush(self):
+        """Writes the summaries of all the suppressed records."""
+        with self._lock:
+            summaries = self._sweep(self._clock(), everything=True)
+        _emit_summaries(summaries)
+
+
+def _emit_summaries(summaries):
+    for record, suppressed in summaries:
+        summary = logging.makeLogRecord(record.__dict__)
+        summary.msg = "%s (%d similar messages were suppressed)" % (
+            record.msg,
+            suppressed,
+        )
+        # the summaries are not filtered again
+        summary.bob_filtered = True
+        logging.getLogger(record.name).handle(summary)
+
+
+class RateLimitFilter(_SuppressingFilter):
+    """Lets at most ``rate`` records per second of each message template (and
+    logger) pass, with bursts of up to ``burst`` records (a token bucket).
+
+    Parameters
+    ----------
+    rate : float
+        The number of records per second that pass in the long run.
+    burst : int
+        The number of records that may pass at once.
+    """
+
+    def __init__(self, rate=1.0, burst=10):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+
+    def _new_state(self, now):
+        # tokens, time of the last refill, suppressed records
+        return [self.burst - 1, now, 0]
+
+    def _may_pass(self, state, now):
+        return state[0] + (now - state[1]) * self.rate >= 1
+
+    def _allow(self, state, now):
+        tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        if tokens < 1:
+            state[0] = tokens
+            return False
+        state[0] = tokens - 1
+        return True
+
+
+class DeduplicateFilter(_SuppressingFilter):
+    """Lets one record of each message template (and logger) pass every
+    ``interval`` seconds. The next record that passes reports how many similar
+    records were suppressed in the meantime.
+
+    Parameters
+    ----------
+    interval : float
+        The number of seconds during which the repetitions of a message are
+        suppressed.
+    """
+
+    def __init__(self, interval=60.0):
+        super().__init__()
+        self.interval = interval
+
+    def _new_state(self, now):
+        # time of the last record that passed, suppressed records
+        return [now, 0]
+
+    def _may_pass(self, state, now):
+        return now - state[0] >= self.interval
+
+    def _allow(self, state, now):
+        if not self._may_pass(state, now):
+            return False
+        state[0] = now
+        return True
+
+
+class _Filters(logging.Filter):
+    """Applies the filters given to :py:func:`setup` once to each record, even
+    if the record goes through several of our handlers (e.g. the queue handler
+    and then the stream handlers, or the handlers of a worker process and then
+    those of the aggregating process)."""
+
+    def __init__(self):
+        super().__init__()
+        self.filters = []
+
+    def filter(self, record):
+        passed = getattr(record, "bob_filtered", None)
+        if passed is None:
+            passed = all(f.filter(record) for f in self.filters)
+            record.bob_filtered = passed
+        return passed
+
+
+_filters = _Filters()
+_warn_err.addFilter(_filters)
+_debug_info.addFilter(_filters)
+
+
+def _flush_filters():
+    for f in list(_filters.filters):
+        if isinstance(f, _SuppressingFilter):
+            f.flush()
+
+
+OVERFLOW_POLICIES = ("block", "drop", "drop_oldest")
+"""What happens to a log record when the queue of the asynchronous mode (see
+:py:func:`setup`) is full: the logging thread waits (``block``), the record is
+discarded (``drop``), or the oldest record of the queue is discarded to make
+room for it (``drop_oldest``)."""
+
+# the loggers set up through setup(), whose handlers change with the mode
+_loggers = {"bob"}
+_lock = threading.RLock()
+_listener = None
+_queue_handler = None
+_aggregator = None
+_worker_handler = None
+_worker_address = None
+
+
+_exception_formatter = logging.Formatter()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the records with their message built but not formatted, so
+    that formatting happens in the thread of the listener, and applies the
+    overflow policy."""
+
+    def __init__(self, queue, overflow):
+        super().__init__(queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the arguments may be modified before the listener runs, so the
+        # message is built now
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(
+                    record.exc_info
+                )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == "drop":
+                    return
+            try:
+                # drop_oldest
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # wait for room in the queue instead of failing when it is full
+        self.queue.put(self._sentinel)
+
+
+def _handlers():
+    if _worker_handler is not None:
+        return [_worker_handler]
+    if _queue_handler is not None:
+        return [_queue_handler]
+    return [_warn_err, _debug_info]
+
+
+def _set_handlers(name, handlers):
+    logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        ours = handler in (_warn_err, _debug_info)
+        if (
+            ours or isinstance(handler, (_QueueHandler, _WorkerHandler))
+        ) and handler not in handlers:
+            logger.removeHandler(handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+def _start_listener(queue_size, overflow):
+    global _listener, _queue_handler
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(
+            "The overflow policy `%s' does not exist. Use one of: %s"
+            % (overflow, ", ".join(OVERFLOW_POLICIES))
+        )
+    records = queue.Queue(maxsize=queue_size)
+    _queue_handler = _QueueHandler(records, overflow)
+    # suppressed records are not queued
+    _queue_handler.addFilter(_filters)
+    _listener = _QueueListener(
+        records, _warn_err, _debug_info, respect_handler_level=True
+    )
+    _listener.start()
+    for name in _loggers:
+        _set_handlers(name, _handlers())
+
+
+def _stop_listener():
+    """Writes the records left in the queue and goes back to synchronous
+    logging."""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        handler, listener = _queue_handler, _listener
+        _queue_handler = _listener = None
+        for name in _loggers:
+            _set_handlers(name, _handlers())
+        listener.stop()
+    if handler.dropped:
+        _logger.warning(
+            "%d log records were dropped because the log queue was full",
+            handler.dropped,
+        )
+
+
+atexit.register(_stop_listener)
+
+
+def _dispatch(record):
+    """Writes a record received from a worker process."""
+    # tag each line with the worker that logged it
+    record.msg = "[%s[%d]] %s" % (
+        record.processName,
+        record.process,
+        record.getMessage(),
+    )
+    record.args = None
+    for handler in _handlers():
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+class _RecordStreamHandler(socketserver.StreamRequestHandler):
+    """Reads the records sent by the :py:class:`_WorkerHandler` of a worker
+    process (in the format of :py:class:`logging.handlers.SocketHandler`)."""
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            (length,) = struct.unpack(">L", header)
+            data = self.rfile.read(length)
+            if len(data) < length:
+                return
+            _dispatch(logging.makeLogRecord(pickle.loads(data)))
+
+
+class _Aggregator(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self):
+        # a private folder, as the records are unpickled
+        self.folder = tempfile.mkdtemp(prefix="bob_log_")
+        super().__init__(
+            os.path.join(self.folder, "socket"), _RecordStreamHandler
+        )
+        self.thread = threading.Thread(
+            target=self.serve_forever, name="bob-log-aggregator", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class _WorkerHandler(logging.handlers.SocketHandler):
+    """Sends the records of a worker process to the aggregating process."""
+
+    def __init__(self, address):
+        super().__init__(address, None)
+
+
+def _start_aggregator():
+    global _aggregator
+    _aggregator = _Aggregator()
+
+
+def _stop_aggregator():
+    global _aggregator
+    with _lock:
+        if _aggregator is None:
+            return
+        aggregator, _aggregator = _aggregator, None
+    aggregator.stop()
+
+
+atexit.register(_stop_aggregator)
+# runs first, while the handlers still work
+atexit.register(_flush_filters)
+
+
+def aggregator_address():
+    """Returns where the worker processes send their logs, to be given to
+    :py:func:`init_worker`.
+
+    Returns
+    -------
+    str or None
+        The bob log level and the address of the aggregating process (see
+        :py:func:`setup`), or None if the logs are not aggregated.
+    """
+    if _aggregator is not None:
+        address = _aggregator.server_address
+    elif _worker_handler is not None:
+        address = _worker_address
+    else:
+        return None
+    return "%d:%s" % (_logger.getEffectiveLevel(), address)
+
+
+def init_worker(address):
+    """Sends the logs of a worker process to the process that aggregates them
+    (see :py:func:`setup`). Use it as the initializer of the workers that are
+    not forked from the aggregating process (e.g. with the ``spawn`` or
+    ``forkserver`` methods)::
+
+        context = multiprocessing.get_context("spawn")
+        pool = context.Pool(
+            4, initializer=init_worker, initargs=(aggregator_address(),)
+        )
+
+    Parameters
+    ----------
+    address : str or None
+        The value returned by :py:func:`aggregator_address` in the aggregating
+        process. Nothing happens if it is None.
+    """
+    if address is None:
+        return
+    with _lock:
+        _become_worker(address)
+
+
+def _become_worker(value):
+    """Sends the records of the loggers set up through :py:func:`setup` to the
+    aggregating process given by ``value``."""
+    global _worker_handler, _worker_address
+    level, address = value.split(":", 1)
+    _worker_address = address
+    _worker_handler = _WorkerHandler(address)
+    _worker_handler.addFilter(_filters)
+    _logger.setLevel(int(level))
+    for name in _loggers:
+        _set_handlers(name, _handlers())
+
+
+def _after_fork_in_child():
+    global _lock, _listener, _queue_handler, _aggregator
+    # the threads of the parent do not exist in the child
+    _lock = threading.RLock()
+    if _aggregator is not None or _worker_handler is not None:
+        # forked workers send their logs to the aggregator (a worker of a
+        # worker connects to it on its own)
+        address = aggregator_address()
+        _aggregator = None
+        _listener = _queue_handler = None
+        _become_worker(address)
+    elif _listener is not None:
+        _listener = _queue_handler = None
+        for name in _loggers:
+            _set_handlers(name, _handlers())
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def flush():
+    """Waits until all the records logged so far in the asynchronous mode (see
+    :py:func:`setup`) are written, after the summaries of the records
+    suppressed by :py:class:`RateLimitFilter` and
+    :py:class:`DeduplicateFilter`."""
+    _flush_filters()
+    listener = _listener
+    if listener is not None:
+        listener.queue.join()
+
+
 # helper functions to instantiate and set-up logging
 def setup(
-    logger_name, format="%(name)s@%(asctime)s -- %(levelname)s: %(message)s"
+    logger_name,
+    format="%(name)s@%(asctime)s -- %(levelname)s: %(message)s",
+    asynchronous=None,
+    queue_size=10000,
+    overflow="block",
+    aggregate=None,
+    filters=(),
 ):
     """This function returns a logger object that is set up to perform logging
     using Bob loggers.
@@ -45,20 +547,66 @@ def setup(
         The format of the logs, see :py:class:`logging.LogRecord` for more
         details. By default, the log contains the logger name, the log time, the
         log level and the massage.
+    asynchronous : :obj:`bool`, optional
+        If True, the log records of all Bob loggers are put in a queue and
+        formatted and written by a background thread, so that logging does not
+        wait for slow terminals or file systems. The remaining records are
+        written when the program exits (or by :py:func:`flush`). If False,
+        records are written synchronously. By default, the current mode is
+        kept.
+    queue_size : :obj:`int`, optional
+        The maximum number of records waiting in the queue of the asynchronous
+        mode. Only used when switching to it.
+    overflow : :obj:`str`, optional
+        What happens to a record when the queue is full, see
+        :py:attr:`OVERFLOW_POLICIES`. Only used when switching to the
+        asynchronous mode.
+    aggregate : :obj:`bool`, optional
+        If True, this process aggregates the logs of its worker processes (e.g.
+        those of a :py:class:`multiprocessing.pool.Pool`): the records of the
+        workers are sent through a local socket and written once by this
+        process, each line tagged with the name and the id of the worker
+        process. Forked workers do so automatically, while the other ones must
+        call :py:func:`init_worker`. By default, nothing changes.
+    filters : :obj:`list`, optional
+        Filters applied to the records of all the loggers set up through this
+        function and of their children, e.g. :py:class:`RateLimitFilter` or
+        :py:class:`DeduplicateFilter` to tame the messages logged in loops. The
+        records they suppress are neither formatted nor written.
 
     Returns
     -------
     logger : :py:class:`logging.Logger`
         The logger configured for logging. The same logger can be retrieved using
         the :py:func:`logging.getLogger` function.
+
+    Raises
+    ------
+    ValueError
+        If the overflow policy does not exist.
     """
     # generate new logger object
     logger = logging.getLogger(logger_name)
 
-    # add log the handlers if not yet done
-    if not logger_name.startswith("bob") and not logger.handlers:
-        logger.addHandler(_warn_err)
-        logger.addHandler(_debug_info)
+    with _lock:
+        if asynchronous and _listener is None:
+            _start_listener(queue_size, overflow)
+        elif asynchronous is False and _listener is not None:
+            _stop_listener()
+
+        if aggregate and _aggregator is None and _worker_handler is None:
+            _start_aggregator()
+        elif aggregate is False and _aggregator is not None:
+            _stop_aggregator()
+
+        # add log the handlers if not yet done
+        if not logger_name.startswith("bob") and not logger.handlers:
+            _loggers.add(logger_name)
+            _set_handlers(logger_name, _handlers())
+
+    for f in filters:
+        if f not in _filters.filters:
+            _filters.filters.append(f)
 
     # this formats the logger to print the desired information
     formatter = logging.Formatter(format)
@@ -67,8 +615,9 @@ def setup(
     for handler in logger.handlers:
         handler.setFormatter(formatter)
 
-    # set the same formatter for bob loggers
-    for handler in _logger.handlers:
+    # set the same formatter for bob loggers (their handlers are hidden behind
+    # the queue in the asynchronous mode)
+    for handler in _logger.handlers + [_warn_err, _debug_info]:
         handler.setFormatter(formatter)
 
     return logger
@@ -3,11 +3,24 @@
 
 """Implements a global configuration system for bob using json."""
 
+import bisect
+import contextlib
+import contextvars
+import fnmatch
+import functools
+import itertools
 import json
 import logging
 import os
+import re
+import shutil
+import sys
+import threading
 
-from collections import defaultdict
+from collections import ChainMap, defaultdict
+from collections.abc import MutableMapping
+
+from .utils import file_lock
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +30,25 @@ ENVNAME = "BOBRC"
 RCFILENAME = "~" + os.sep + ".bobrc"
 """Default name to be used for the RC file to load"""
 
+SYSTEM_RCFILENAMES = (
+    os.path.join(os.sep, "etc", "bobrc"),
+    os.path.join(sys.prefix, "etc", "bobrc"),
+)
+"""Site-wide RC files, loaded before (and overridden by) the user's RC file"""
+
+PROJECT_RCFILENAME = ".bobrc"
+"""Name of the project RC file, looked up in the current directory and its
+parents, which overrides the user's RC file"""
+
+ENVPREFIX = ENVNAME + "_"
+"""Prefix of the environment variables that override single keys of the RC
+files, e.g. ``BOBRC_BOB_DATA_FOLDER`` for ``bob_data_folder``. Double
+underscores are replaced by dots, e.g. ``BOBRC_BOB__DB__ATNT__DIRECTORY`` for
+``bob.db.atnt.directory``."""
+
+WATCH_INTERVAL = 2.0
+"""Default number of seconds between two checks of :py:meth:`RCWatcher`"""
+
 
 def _get_rc_path():
     """Returns the path to the bob rc file.
@@ -39,11 +71,100 @@ def _get_rc_path():
     return path
 
 
-def _loadrc():
+def _is_own_file(path):
+    """Whether ``path`` is a file owned by the current user."""
+    if not os.path.isfile(path):
+        return False
+    return not hasattr(os, "getuid") or os.stat(path).st_uid == os.getuid()
+
+
+def _get_project_rc_path():
+    """Returns the path to the nearest :py:attr:`PROJECT_RCFILENAME` in the
+    current directory or its parents, or None if there is none. The search
+    stops at the user's home directory, whose ``.bobrc`` is never considered a
+    project RC file. Files owned by other users (e.g. in ``/tmp``) are ignored,
+    so that they cannot change the configuration of everyone working there."""
+    home = os.path.expanduser("~")
+    directory = os.getcwd()
+    while directory != home:
+        path = os.path.join(directory, PROJECT_RCFILENAME)
+        if _is_own_file(path):
+            return path
+        if os.path.isfile(path):
+            logger.debug("Ignoring `%s', owned by another user", path)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return None
+
+
+def _get_rc_layers():
+    """Returns the paths to the RC files by increasing order of precedence:
+
+    1. The site-wide RC files (:py:attr:`SYSTEM_RCFILENAMES`)
+    2. The user's RC file (see :py:func:`_get_rc_path`)
+    3. The project RC file (see :py:func:`_get_project_rc_path`)
+
+    The site-wide and project RC files are only returned if they exist.
+    """
+    layers = [p for p in dict.fromkeys(SYSTEM_RCFILENAMES) if os.path.isfile(p)]
+    layers.append(_get_rc_path())
+    project_path = _get_project_rc_path()
+    if project_path is not None:
+        layers.append(project_path)
+    return layers
+
+
+def _get_env_overrides():
+    """Returns the keys set through the :py:attr:`ENVPREFIX` environment
+    variables."""
+    return {
+        name[len(ENVPREFIX) :].lower().replace("__", "."): value
+        for name, value in os.environ.items()
+        if name.startswith(ENVPREFIX) and len(name) > len(ENVPREFIX)
+    }
+
+
+def _default_none():
+    # a module-level function (not a lambda) so that the rc can be pickled
+    return None
+
+
+def _default_none_dict(dct):
+    dct2 = defaultdict(_default_none)
+    dct2.update(dct)
+    return dct2
+
+
+def _stat_key(stat):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+
+def _rc_signature():
+    """Returns a value that changes whenever one of the rc layers is
+    modified."""
+    signature = []
+    for path in _get_rc_layers():
+        try:
+            signature.append((path, _stat_key(os.stat(path))))
+        except FileNotFoundError:
+            signature.append((path, None))
+    signature.append(tuple(sorted(_get_env_overrides().items())))
+    return tuple(signature)
+
+
+def _loadrc(path=None):
     """Loads the default configuration file, or an override if provided
 
     This method will load **exactly** one (global) resource configuration file as
-    returned by :py:func:`_get_rc_path`.
+    returned by :py:func:`_get_rc_path`, through the backend matching its
+    format (see :py:func:`_get_backend`).
+
+    Parameters:
+
+      path (:obj:`str`, optional): The RC file to load instead of the user's
+      one.
 
     Returns:
 
@@ -51,21 +172,412 @@ def _loadrc():
       loading the provided modules and resolving all variables.
 
     """
-
-    def _default_none_dict(dct):
-        dct2 = defaultdict(lambda: None)
-        dct2.update(dct)
-        return dct2
-
-    path = _get_rc_path()
+    path = path or _get_rc_path()
     if not os.path.exists(path):
-        logger.debug("No RC file found")
+        logger.debug("No RC file found at `%s'", path)
         return _default_none_dict({})
+    return _get_backend(path).load()
+
+
+_overrides = contextvars.ContextVar("bob_rc_overrides", default=None)
+"""The :py:class:`collections.ChainMap` of the values overridden with
+:py:func:`bob.extension.rc_context` in the current thread or asyncio task"""
+
+_DELETED = object()
+"""Marks the keys deleted while an override is active"""
+
+
+def _load_layers():
+    """Loads and merges all rc layers (see :py:func:`_get_rc_layers`) and the
+    :py:attr:`ENVPREFIX` environment variables. Keys of the later layers
+    override those of the earlier ones. Each file is parsed again only if it
+    changed (see :py:func:`_loadrc`)."""
+    context = _default_none_dict({})
+    for path in _get_rc_layers():
+        context.update(_loadrc(path))
+    context.update(_get_env_overrides())
+    return context
+
+
+class KeyIndex:
+    """An index of rc keys for prefix, substring, glob and regular expression
+    searches.
+
+    Keys are kept sorted, so that the keys starting with a prefix form a
+    contiguous range found by bisection (like a walk in a prefix trie).
+    Substrings are searched for in a single string joining all the keys, which
+    is much faster than testing each key in Python. All searches return sorted
+    keys without duplicates.
+
+    Parameters
+    ----------
+    keys : iterable
+        The keys to index.
+    """
+
+    _SEPARATOR = "\0"
+
+    def __init__(self, keys):
+        self.keys = sorted(set(keys))
+        self._text = self._SEPARATOR.join(self.keys) + self._SEPARATOR
+        self._offsets = list(
+            itertools.accumulate((len(k) + 1 for k in self.keys), initial=0)
+        )
+
+    def __len__(self):
+        return len(self.keys)
 
-    logger.debug("Loading RC file `%s'...", path)
+    def prefix(self, prefix):
+        """Returns the keys starting with ``prefix``."""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        return self.keys[start:end]
 
-    with open(path, "rt") as f:
-        return json.load(f, object_hook=_default_none_dict)
+    def contains(self, substring):
+        """Returns the keys containing ``substring``."""
+        if not substring:
+            return list(self.keys)
+        if self._SEPARATOR in substring:
+            return [k for k in self.keys if substring in k]
+        found = []
+        position = self._text.find(substring)
+        while position != -1:
+            i = bisect.bisect_right(self._offsets, position) - 1
+            found.append(self.keys[i])
+            # continue after the end of the matching key
+            position = self._text.find(substring, self._offsets[i + 1])
+        return found
+
+    def glob(self, pattern):
+        """Returns the keys matching a shell-style pattern (see
+        :py:mod:`fnmatch`)."""
+        literal = re.match(r"[^*?\[]*", pattern).group(0)
+        regex = re.compile(fnmatch.translate(pattern))
+        return [k for k in self.prefix(literal) if regex.match(k)]
+
+    def regex(self, pattern):
+        """Returns the keys in which the regular expression ``pattern`` is
+        found."""
+        regex = re.compile(pattern)
+        return [k for k in self.keys if regex.search(k)]
+
+    def search(self, prefix=None, contains=None, glob=None, regex=None):
+        """Returns the keys matching all the given criteria.
+
+        Parameters
+        ----------
+        prefix : :obj:`str`, optional
+            The keys must start with this prefix.
+        contains : :obj:`str`, optional
+            The keys must contain this substring.
+        glob : :obj:`str`, optional
+            The keys must match this shell-style pattern.
+        regex : :obj:`str`, optional
+            The keys must contain a match of this regular expression.
+
+        Returns
+        -------
+        list
+            The sorted matching keys.
+        """
+        keys = None
+        for method, value in (
+            (self.prefix, prefix),
+            (self.glob, glob),
+            (self.contains, contains),
+            (self.regex, regex),
+        ):
+            if value is None:
+                continue
+            found = method(value)
+            keys = found if keys is None else sorted(set(keys) & set(found))
+        return list(self.keys) if keys is None else keys
+
+
+class _LazyRC(MutableMapping):
+    """The global configuration, loaded through :py:func:`_load_layers` the
+    first time it is accessed. Like a :py:class:`collections.defaultdict`, the
+    value of any non-existing key is ``None``. Changes made to it are not saved
+    into the rc files; use :py:func:`transaction` for that. Inside
+    :py:func:`bob.extension.rc_context`, changes are made to the overrides and
+    discarded when the context exits."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._context = None
+        self._signature = None
+        self._callbacks = []
+        self._watcher = None
+        self._index = None
+
+    def _load(self):
+        # taken before reading, so that a concurrent change triggers a reload
+        signature = _rc_signature()
+        context = _load_layers()
+        self._signature = signature
+        return context
+
+    @property
+    def context(self):
+        """The loaded configuration dictionary"""
+        if self._context is None:
+            with self._lock:
+                if self._context is None:
+                    self._context = self._load()
+        return self._context
+
+    def invalidate(self):
+        """Discards the loaded configuration (and any in-memory change to it)
+        so that the rc file is loaded again on the next access."""
+        with self._lock:
+            self._context = None
+
+    def changed(self):
+        """Whether one of the rc files changed since they were loaded."""
+        return self._context is not None and self._signature != _rc_signature()
+
+    def reload(self):
+        """Loads the rc file again and notifies the subscribers of the changes.
+
+        Returns
+        -------
+        set
+            The keys whose value changed.
+        """
+        with self._lock:
+            old = self._context or {}
+            self._context = new = self._load()
+            changed = {
+                key
+                for key in set(old) | set(new)
+                if old.get(key) != new.get(key)
+            }
+            callbacks = list(self._callbacks)
+        if changed:
+            logger.debug("The rc keys %s changed", sorted(changed))
+            for callback in callbacks:
+                try:
+                    callback(changed)
+                except Exception:
+                    logger.error(
+                        "The rc callback %r failed", callback, exc_info=True
+                    )
+        return changed
+
+    def subscribe(self, callback):
+        """Registers a function to be called with the set of changed keys
+        whenever :py:meth:`reload` finds changes in the rc file."""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        """Unregisters a function given to :py:meth:`subscribe`."""
+        with self._lock:
+            self._callbacks.remove(callback)
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Starts (if not already started) a background thread that reloads the
+        rc whenever the rc file changes.
+
+        Parameters
+        ----------
+        interval : float
+            The number of seconds between two checks of the rc file.
+
+        Returns
+        -------
+        RCWatcher
+            The running watcher. Call its ``stop`` method to stop watching.
+        """
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = RCWatcher(self, interval)
+                self._watcher.start()
+            else:
+                self._watcher.interval = interval
+            return self._watcher
+
+    @contextlib.contextmanager
+    def overlay(self, values):
+        """Temporarily overrides some values, without copying the rc. See
+        :py:func:`bob.extension.rc_context`."""
+        parent = _overrides.get()
+        maps = parent.maps if parent is not None else []
+        token = _overrides.set(ChainMap(dict(values), *maps))
+        try:
+            yield
+        finally:
+            _overrides.reset(token)
+
+    def search(self, prefix=None, contains=None, glob=None, regex=None):
+        """Returns the sorted keys matching all the given criteria. See
+        :py:meth:`KeyIndex.search` for the parameters. The index of the keys
+        is built on the first search and kept until the keys change."""
+        context = self.context
+        index = self._index
+        if (
+            index is None
+            or index[0] is not context
+            or len(index[1]) != len(context)
+        ):
+            index = self._index = (context, KeyIndex(context))
+        keys = index[1].search(prefix, contains, glob, regex)
+        overrides = _overrides.get()
+        if overrides is None:
+            return keys
+        # the overrides are few, so they are searched without an index
+        keys = [k for k in keys if k not in overrides]
+        overridden = KeyIndex(
+            k for k, v in overrides.items() if v is not _DELETED
+        )
+        return sorted(keys + overridden.search(prefix, contains, glob, regex))
+
+    def __getitem__(self, key):
+        overrides = _overrides.get()
+        if overrides is not None and key in overrides:
+            value = overrides[key]
+            return None if value is _DELETED else value
+        return self.context[key]
+
+    def __setitem__(self, key, value):
+        overrides = _overrides.get()
+        if overrides is not None:
+            overrides[key] = value
+        else:
+            self.context[key] = value
+            self._index = None
+
+    def __delitem__(self, key):
+        overrides = _overrides.get()
+        if overrides is None:
+            del self.context[key]
+            self._index = None
+        elif key not in self:
+            raise KeyError(key)
+        else:
+            overrides[key] = _DELETED
+
+    def __iter__(self):
+        overrides = _overrides.get()
+        if overrides is None:
+            return iter(self.context)
+        return itertools.chain(
+            (k for k in self.context if k not in overrides),
+            (k for k, v in overrides.items() if v is not _DELETED),
+        )
+
+    def __len__(self):
+        if _overrides.get() is None:
+            return len(self.context)
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        overrides = _overrides.get()
+        if overrides is not None and key in overrides:
+            return overrides[key] is not _DELETED
+        return key in self.context
+
+    def get(self, key, default=None):
+        overrides = _overrides.get()
+        if overrides is not None and key in overrides:
+            value = overrides[key]
+            return default if value is _DELETED else value
+        return self.context.get(key, default)
+
+    def clear(self):
+        if _overrides.get() is None:
+            self.context.clear()
+            self._index = None
+        else:
+            for key in list(self):
+                del self[key]
+
+    def update(self, *args, **kwargs):
+        if _overrides.get() is None:
+            self.context.update(*args, **kwargs)
+            self._index = None
+        else:
+            MutableMapping.update(self, *args, **kwargs)
+
+    def copy(self):
+        if _overrides.get() is None:
+            return self.context.copy()
+        return _default_none_dict({k: self[k] for k in self})
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+def with_rc_context(func):
+    """Makes the :py:func:`bob.extension.rc_context` overrides active where
+    this function is called available to ``func`` when it runs in another
+    thread. For example::
+
+        with rc_context({"bob_data_folder": folder}):
+            with ThreadPoolExecutor() as executor:
+                executor.map(with_rc_context(get_file), ...)
+
+    Parameters
+    ----------
+    func : callable
+        The function to wrap.
+
+    Returns
+    -------
+    callable
+        A function that calls ``func`` with the current overrides.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # a context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+class RCWatcher(threading.Thread):
+    """A daemon thread that polls the rc files and reloads the global
+    configuration when one of them changes. Checking the files costs one
+    ``stat`` call per file, so short intervals are cheap. Use :py:meth:`_LazyRC.watch` (i.e.
+    ``bob.extension.rc.watch()``) to start one.
+
+    Parameters
+    ----------
+    rc : _LazyRC
+        The configuration to keep up to date.
+    interval : float
+        The number of seconds between two checks of the rc file.
+    """
+
+    def __init__(self, rc, interval=WATCH_INTERVAL):
+        super().__init__(name="bob-rc-watcher", daemon=True)
+        self.rc = rc
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def check(self):
+        """Reloads the rc if it changed and returns the changed keys."""
+        if not self.rc.changed():
+            return set()
+        logger.info("The rc file changed; reloading it")
+        return self.rc.reload()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.error("Could not reload the rc file", exc_info=True)
+
+    def stop(self):
+        """Stops watching the rc file."""
+        self._stopped.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
 
 
 def _rc_to_str(context):
@@ -82,19 +594,387 @@ def _rc_to_str(context):
         The configurations in a JSON formatted string.
     """
 
-    return json.dumps(context, sort_keys=True, indent=4, separators=(",", ": "))
+    return json.dumps(
+        dict(context), sort_keys=True, indent=4, separators=(",", ": ")
+    )
+
+
+def _get_lock_path(path):
+    return path + ".lock"
+
+
+def _writerc(path, context):
+    """Atomically replaces the content of the rc file at ``path``: readers see
+    either the old or the new content, even if this process crashes."""
+    # keep dotfiles managed through symbolic links working
+    path = os.path.realpath(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wt") as f:
+            f.write(_rc_to_str(context))
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class RCBackend:
+    """The storage of an rc file.
+
+    Backends must implement :py:meth:`load` and :py:meth:`save`. The other
+    methods are implemented on top of them and may be overridden by backends
+    that can do better than reading and writing the whole file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the rc file.
+    """
+
+    name = None
+    """The name of the backend, e.g. for ``bob config migrate``"""
+
+    magic = None
+    """The first bytes of the files written by this backend, used to detect
+    it"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Returns the content of the rc file as a dictionary."""
+        raise NotImplementedError
+
+    def save(self, context):
+        """Replaces the content of the rc file with ``context``. The caller
+        holds the :py:meth:`lock`."""
+        raise NotImplementedError
+
+    def lock(self):
+        """Returns a context manager that locks the rc file for writing."""
+        return file_lock(_get_lock_path(self.path))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Locks and loads the rc file, yields its content and saves it back
+        if the context exits without an exception."""
+        with self.lock():
+            context = self.load()
+            yield context
+            self.save(context)
+
+    def get(self, key):
+        """Returns the value of a key, or None if it does not exist."""
+        return self.load().get(key)
+
+    def get_many(self, keys):
+        """Returns a dictionary with the values of several keys (None for the
+        keys that do not exist)."""
+        context = self.load()
+        return {key: context.get(key) for key in keys}
+
+    def set(self, key, value):
+        """Sets the value of a key."""
+        with self.transaction() as context:
+            context[key] = value
+
+    def delete(self, keys):
+        """Deletes keys, ignoring the ones that do not exist."""
+        with self.transaction() as context:
+            for key in keys:
+                context.pop(key, None)
+
+    def search(self, prefix=None, contains=None):
+        """Returns the sorted keys that start with ``prefix`` and contain
+        ``contains`` (see :py:class:`KeyIndex`)."""
+        return KeyIndex(self.load()).search(prefix=prefix, contains=contains)
+
+
+class JSONBackend(RCBackend):
+    """Stores the rc as a pretty-printed JSON file, which is easy to edit by
+    hand."""
+
+    name = "json"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return _default_none_dict({})
+
+        logger.debug("Loading RC file `%s'...", self.path)
+
+        with open(self.path, "rt") as f:
+            return json.load(f, object_hook=_default_none_dict)
+
+    def save(self, context):
+        _writerc(self.path, context)
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def _decode(value):
+    return json.loads(value, object_hook=_default_none_dict)
+
+
+class SQLiteBackend(RCBackend):
+    """Stores the rc in an SQLite database with one (indexed) row per key, so
+    that getting, setting and deleting a key or looking up the keys that start
+    with a prefix do not read or write the whole file. Values are stored in
+    JSON."""
+
+    name = "sqlite"
+    magic = b"SQLite format 3\x00"
+
+    def _connect(self):
+        # imported here to keep importing bob.extension cheap
+        import sqlite3
+
+        connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rc "
+            "(key TEXT PRIMARY KEY NOT NULL, value TEXT NOT NULL)"
+        )
+        return contextlib.closing(connection)
+
+    def _load(self, connection):
+        return dict(connection.execute("SELECT key, value FROM rc"))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return _default_none_dict({})
+        with self._connect() as connection:
+            rows = self._load(connection)
+        return _default_none_dict({k: _decode(v) for k, v in rows.items()})
+
+    def save(self, context):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM rc")
+            connection.executemany(
+                "INSERT INTO rc VALUES (?, ?)",
+                [(k, _encode(v)) for k, v in context.items()],
+            )
+            connection.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # only the keys that changed are written back
+        with self.lock(), self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._load(connection)
+                context = _default_none_dict(
+                    {k: _decode(v) for k, v in rows.items()}
+                )
+                yield context
+                connection.executemany(
+                    "DELETE FROM rc WHERE key = ?",
+                    [(k,) for k in rows if k not in context],
+                )
+                encoded = {k: _encode(v) for k, v in context.items()}
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rc VALUES (?, ?)",
+                    [(k, v) for k, v in encoded.items() if rows.get(k) != v],
+                )
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def get(self, key):
+        if not os.path.exists(self.path):
+            return None
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM rc WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else _decode(row[0])
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = dict.fromkeys(keys)
+        if not keys or not os.path.exists(self.path):
+            return values
+        with self._connect() as connection:
+            # stay below the limit on the number of SQL variables
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = connection.execute(
+                    "SELECT key, value FROM rc WHERE key IN (%s)"
+                    % ", ".join("?" * len(chunk)),
+                    chunk,
+                )
+                values.update((k, _decode(v)) for k, v in rows)
+        return values
+
+    def set(self, key, value):
+        with self.lock(), self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO rc VALUES (?, ?)", (key, _encode(value))
+            )
+
+    def delete(self, keys):
+        with self.lock(), self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "DELETE FROM rc WHERE key = ?", [(k,) for k in keys]
+            )
+            connection.execute("COMMIT")
+
+    def search(self, prefix=None, contains=None):
+        if not os.path.exists(self.path):
+            return []
+        query, parameters = "SELECT key FROM rc WHERE 1", []
+        if prefix:
+            # a range over the primary key index
+            query += " AND key >= ?"
+            parameters.append(prefix)
+            if ord(prefix[-1]) < sys.maxunicode:
+                query += " AND key < ?"
+                parameters.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+            else:
+                query += " AND substr(key, 1, ?) = ?"
+                parameters += [len(prefix), prefix]
+        if contains:
+            query += " AND instr(key, ?) > 0"
+            parameters.append(contains)
+        with self._connect() as connection:
+            return [
+                row[0]
+                for row in connection.execute(
+                    query + " ORDER BY key", parameters
+                )
+            ]
+
+
+BACKENDS = {backend.name: backend for backend in (JSONBackend, SQLiteBackend)}
+"""The available rc backends, by name. The backend of an rc file is detected
+through the :py:attr:`RCBackend.magic` header of the file and defaults to
+:py:class:`JSONBackend`."""
+
+
+def _get_backend(path=None):
+    """Returns the backend for the rc file at ``path`` (the user's rc file by
+    default), detected through the first bytes of the file."""
+    path = path or _get_rc_path()
+    try:
+        with open(path, "rb") as f:
+            header = f.read(64)
+    except FileNotFoundError:
+        header = b""
+    for backend in BACKENDS.values():
+        if backend.magic and header.startswith(backend.magic):
+            return backend(path)
+    return JSONBackend(path)
+
+
+def migrate(name, path=None):
+    """Converts an rc file to another backend, keeping its content.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend to convert to (see :py:attr:`BACKENDS`).
+    path : :obj:`str`, optional
+        The rc file to convert. Defaults to the user's rc file.
+
+    Raises
+    ------
+    ValueError
+        If the backend does not exist.
+    """
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown rc backend `{name}'. Use one of: {', '.join(BACKENDS)}"
+        )
+    path = path or _get_rc_path()
+    with file_lock(_get_lock_path(path)):
+        backend = _get_backend(path)
+        if backend.name == name:
+            return
+        logger.info("Converting `%s' to %s", path, name)
+        context = backend.load()
+        path = os.path.realpath(path)
+        tmp_path = f"{path}.{os.getpid()}.{name}"
+        try:
+            BACKENDS[name](tmp_path).save(context)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_transactions = threading.local()
+
+
+@contextlib.contextmanager
+def transaction():
+    """A context manager to modify the user's rc file (see
+    :py:func:`_get_rc_path`).
+
+    The rc file is locked, loaded and yielded as a dictionary. The dictionary is
+    written back (atomically) when the context exits without an exception, so
+    that concurrent changes, e.g. from several ``bob config set`` commands, are
+    not lost. Nested transactions share the dictionary of the outermost one.
+
+    Example
+    -------
+    >>> from bob.extension.rc_config import transaction
+    >>> with transaction() as context:  # doctest: +SKIP
+    ...     context["bob.db.atnt.directory"] = "/data/atnt"
+    ...     del context["bob.db.mobio.directory"]
+
+    Yields
+    ------
+    dict
+        The content of the rc file.
+    """
+    context = getattr(_transactions, "context", None)
+    if context is not None:
+        yield context
+        return
+
+    with _get_backend().transaction() as context:
+        _transactions.context = context
+        try:
+            yield context
+        finally:
+            _transactions.context = None
 
 
 def _saverc(context):
-    """Saves the context into the global rc file.
+    """Saves the context into the user's rc file.
 
     Parameters
     ----------
     context : dict
-        All the configurations to save into the rc file.
+        All the configurations to save into the rc file. If this is the global
+        ``rc``, only the changes made to it in memory are saved (through
+        :py:func:`transaction`), so that the values of the other rc layers and
+        of the environment are not copied into the user's rc file.
     """
 
-    path = _get_rc_path()
-    with open(path, "wt") as f:
-        f.write(_rc_to_str(context))
-        f.write("\n")
+    if isinstance(context, _LazyRC):
+        loaded = _load_layers()
+        changes = context.context
+        with transaction() as user:
+            for key in set(loaded) - set(changes):
+                user.pop(key, None)
+            for key, value in changes.items():
+                if key not in loaded or loaded[key] != value:
+                    user[key] = value
+        return
+
+    backend = _get_backend()
+    with backend.lock():
+        backend.save(context)
@@ -1,13 +1,26 @@
+import io
 import logging
+import os
+import sys
 import textwrap
+import threading
 import time
 import traceback
 
+from collections.abc import Mapping
+
 import click
 
 from click.core import ParameterSource
 
-from ..config import load, mod_to_context, resource_keys
+from ..config import (
+    LazyValue,
+    _timed,
+    load,
+    materialize,
+    mod_to_context,
+    resource_keys,
+)
 from ..log import set_verbosity_level
 
 logger = logging.getLogger(__name__)
@@ -178,6 +191,128 @@ def verbosity_option(**kwargs):
     return custom_verbosity_option
 
 
+PROFILERS = ("cprofile", "tracemalloc")
+"""The profilers available through :py:func:`profile_option`"""
+
+_PROFILE_TOP = 20
+
+
+class _OptionalValueOption(click.Option):
+    """An option whose value can be omitted even when the next argument is not
+    an option (e.g. ``bob --profile config show``): if the next argument is not
+    one of the choices, it is left for the command. This is implemented by
+    :py:meth:`AliasedGroup.parse_args`, as click does not support it."""
+
+
+def _start_profiler(ctx, profiler):
+    if profiler == "cprofile":
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+    else:
+        import tracemalloc
+
+        tracemalloc.start(25)
+        profile = None
+
+    def stop():
+        output = ctx.meta.get("profile_output") or "{}.{}.{}".format(
+            ctx.info_name, os.getpid(), "prof" if profile else "tracemalloc"
+        )
+        if profile is not None:
+            profile.disable()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        summary = io.StringIO()
+        if profile is not None:
+            import pstats
+
+            profile.dump_stats(output)
+            stats = pstats.Stats(profile, stream=summary).strip_dirs()
+            stats.sort_stats("cumulative").print_stats(_PROFILE_TOP)
+        else:
+            snapshot.dump(output)
+            summary.write(
+                "Memory: {:.1f} MiB allocated, {:.1f} MiB at the peak\n".format(
+                    current / 1024**2, peak / 1024**2
+                )
+            )
+            for stat in snapshot.statistics("lineno")[:_PROFILE_TOP]:
+                summary.write(f"{stat}\n")
+        click.echo(summary.getvalue().rstrip("\n"), err=True)
+        click.echo(f"The profile was saved in `{output}'", err=True)
+
+    ctx.call_on_close(stop)
+
+
+def profile_option(**kwargs):
+    """Adds a --profile[=cprofile|tracemalloc] option to a click command (and
+    a --profile-output option to choose where to save the profile).
+
+    The profile covers the execution of the command, including its
+    sub-commands when the command is a group. The profiler can be omitted
+    before a sub-command only in an :py:class:`AliasedGroup` (like ``bob``);
+    elsewhere, write ``--profile=cprofile``. It is saved into a file, which can
+    be loaded with :py:class:`pstats.Stats` or
+    :py:meth:`tracemalloc.Snapshot.load`, and the top functions (or
+    allocations) are printed on stderr.
+
+    Parameters
+    ----------
+    **kwargs
+        All kwargs are passed to click.option.
+
+    Returns
+    -------
+    ``callable``
+        A decorator to be used for adding this option.
+    """
+
+    def custom_profile_option(f):
+        def output_callback(ctx, param, value):
+            if value is not None:
+                ctx.meta["profile_output"] = value
+
+        def callback(ctx, param, value):
+            # a sub-command cannot profile what its group already profiles
+            if value is not None and "profile" not in ctx.meta:
+                ctx.meta["profile"] = value
+                _start_profiler(ctx, value)
+
+        f = click.option(
+            "--profile-output",
+            type=click.Path(dir_okay=False),
+            expose_value=False,
+            is_eager=True,
+            callback=output_callback,
+            help="Where to save the profile (by default, in the current "
+            "directory).",
+        )(f)
+        return click.option(
+            "--profile",
+            cls=_OptionalValueOption,
+            type=click.Choice(PROFILERS),
+            is_flag=False,
+            flag_value=PROFILERS[0],
+            default=None,
+            expose_value=False,
+            callback=callback,
+            help="Profile the command with cProfile (the default) or "
+            "tracemalloc.",
+            **kwargs,
+        )(f)
+
+    return custom_profile_option
+
+
+def _timings(ctx):
+    # shared by all the (sub-)commands of an invocation
+    return ctx.meta.setdefault("timings", [])
+
+
 def _prepare_entry_points(entry_point_group):
     if not entry_point_group:
         return ""
@@ -195,6 +330,38 @@ def _prepare_entry_points(entry_point_group):
     return ret
 
 
+class _LazyConfigContext(Mapping):
+    """The variables of the config files given to a :any:`ConfigCommand`. The
+    files are executed when the first variable is looked up."""
+
+    def __init__(self, paths, entry_point_group, timings):
+        self.paths = paths
+        self.entry_point_group = entry_point_group
+        self.timings = timings
+        self._context = None
+
+    def _load(self):
+        if self._context is None:
+            logger.debug("Augmenting context with config context")
+            self._context = mod_to_context(
+                load(
+                    self.paths,
+                    entry_point_group=self.entry_point_group,
+                    timings=self.timings,
+                )
+            )
+        return self._context
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
 class ConfigCommand(click.Command):
     """A click.Command that can take options both form command line options and
     configuration files. In order to use this class, you **have to** use the
@@ -206,6 +373,18 @@ class ConfigCommand(click.Command):
       The name of the config argument.
     entry_point_group : str
       The name of entry point that will be used to load the config files.
+
+    The config files are only executed when the command runs, so ``--help`` and
+    ``--dump-config`` return without executing them.
+
+    The time spent loading the config files and the resources of the
+    :any:`ResourceOption` options is logged at the debug level and recorded in
+    ``ctx.meta["timings"]``, a list of ``{"phase": ..., "name": ..., "time":
+    ...}`` dictionaries. The phases are ``resolve`` (the resolution of entry
+    point names), ``execute`` (the execution of one config file),
+    ``materialize`` (the building of a :any:`bob.extension.config.LazyValue` of
+    the config files) and ``resource`` (the loading of the resource of one
+    option, including its own ``resolve`` and ``execute`` phases).
     """
 
     def __init__(
@@ -231,12 +410,11 @@ file.""".format(
 
         # Add the config argument to the command
         def configs_argument_callback(ctx, param, value):
-            config_context = load(
-                value, entry_point_group=self.entry_point_group
+            # the config files are only executed when a value is looked up, so
+            # that --help and --dump-config do not execute them
+            ctx.config_context = _LazyConfigContext(
+                value, self.entry_point_group, _timings(ctx)
             )
-            config_context = mod_to_context(config_context)
-            ctx.config_context = config_context
-            logger.debug("Augmenting context with config context")
             return value
 
         click.argument(
@@ -256,6 +434,13 @@ file.""".format(
             callback=self.dump_config,
         )(self)
 
+    def parse_args(self, ctx, args):
+        args = super().parse_args(ctx, args)
+        # execute the config files even if no option looked them up
+        if not ctx.resilient_parsing:
+            ctx.config_context = dict(ctx.config_context)
+        return args
+
     def dump_config(self, ctx, param, value):
         """Generate configuration file from parameters and context
 
@@ -342,7 +527,8 @@ class ResourceOption(click.Option):
     1. If used in commands that are inherited from :any:`ConfigCommand`, it will
        lookup inside the config files (that are provided as argument to the
        command) to resolve its value. Values given explicitly in the command
-       line take precedence.
+       line take precedence. A :any:`bob.extension.config.LazyValue` of the
+       config files is only built when its option looks it up.
 
     2. If `entry_point_group` is provided, it will treat values given to it (by
        any means) as resources to be loaded. Loading is done using :any:`load`.
@@ -454,6 +640,9 @@ class ResourceOption(click.Option):
             # true.
             if hasattr(ctx, "config_context"):
                 value = ctx.config_context.get(self.name)
+                if isinstance(value, LazyValue):
+                    with _timed(_timings(ctx), "materialize", self.name):
+                        value = materialize(value)
 
         # if not from config files, lookup the environment variables
         if value is None:
@@ -480,14 +669,17 @@ class ResourceOption(click.Option):
 
         # if the value is a string and an entry_point_group is provided, load it
         if self.entry_point_group is not None:
+            timings = _timings(ctx)
             while (
                 isinstance(value, str) and value not in self.string_exceptions
             ):
-                value = load(
-                    [value],
-                    entry_point_group=self.entry_point_group,
-                    attribute_name=self.name,
-                )
+                with _timed(timings, "resource", self.name):
+                    value = load(
+                        [value],
+                        entry_point_group=self.entry_point_group,
+                        attribute_name=self.name,
+                        timings=timings,
+                    )
 
         return value
 
@@ -504,6 +696,32 @@ class AliasedGroup(click.Group):
     just set ``cls=AliasedGroup`` parameter in click.group decorator.
     """
 
+    def parse_args(self, ctx, args):
+        """parse_args that gives their default value to the options of
+        :py:func:`profile_option` that are not followed by one of their
+        choices"""
+        args = list(args)
+        optional, takes_value = {}, set()
+        for param in self.get_params(ctx):
+            if isinstance(param, _OptionalValueOption):
+                optional.update(dict.fromkeys(param.opts, param))
+            elif isinstance(param, click.Option) and not (
+                param.is_flag or param.count
+            ):
+                takes_value.update(param.opts)
+        # only the options before the sub-command are ours
+        i = 0
+        while i < len(args) and args[i].startswith("-") and args[i] != "--":
+            param = optional.get(args[i])
+            if param is not None and (
+                i + 1 == len(args) or args[i + 1] not in param.type.choices
+            ):
+                args[i] = f"{args[i]}={param.flag_value}"
+            elif param is not None or args[i] in takes_value:
+                i += 1
+            i += 1
+        return super().parse_args(ctx, args)
+
     def get_command(self, ctx, cmd_name):
         """get_command with prefix aliasing"""
         rv = click.Group.get_command(self, ctx, cmd_name)
@@ -517,6 +735,57 @@ class AliasedGroup(click.Group):
         ctx.fail("Too many matches: %s" % ", ".join(sorted(matches)))
 
 
+class DownloadProgressBar:
+    """A download hook (see :py:func:`bob.extension.download.add_download_hook`)
+    that shows the progress of all running downloads in a single click progress
+    bar.
+
+    Parameters
+    ----------
+    file : :obj:`object`, optional
+        Where to draw the progress bar. Defaults to ``sys.stderr``.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self._bar = None
+        self._received = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event, info):
+        if event not in (
+            "download_start",
+            "download_progress",
+            "download_end",
+        ):
+            return
+        key = (info["url"], info["path"])
+        with self._lock:
+            if event == "download_start":
+                if self._bar is None:
+                    self._bar = click.progressbar(
+                        length=0,
+                        file=self.file or sys.stderr,
+                        show_percent=True,
+                        show_pos=False,
+                    )
+                self._bar.length += info["total"] or 0
+                self._bar.label = "Downloading {}".format(
+                    os.path.basename(info["path"])
+                )
+                self._received[key] = 0
+                self._bar.update(0)
+            elif event == "download_progress":
+                delta = info["bytes"] - self._received.get(key, 0)
+                self._received[key] = info["bytes"]
+                self._bar.update(delta)
+            else:
+                self._received.pop(key, None)
+                if not self._received:
+                    self._bar.render_finish()
+                    self._bar = None
+
+
 def log_parameters(logger_handle, ignore=tuple()):
     """Logs the click parameters with the logging module.
 
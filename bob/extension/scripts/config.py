@@ -1,11 +1,19 @@
 """The manager for bob's main configuration.
 """
 import logging
+import re
 
 import click
 
 from .. import rc
-from ..rc_config import _get_rc_path, _rc_to_str, _saverc
+from ..rc_config import (
+    BACKENDS,
+    _get_backend,
+    _get_env_overrides,
+    _get_rc_layers,
+    _rc_to_str,
+    migrate,
+)
 from .click_helper import AliasedGroup, verbosity_option
 
 # Use the normal logging module. Verbosity and format of logging will be set by
@@ -21,20 +29,22 @@ def config(**kwargs):
     # variable might change the config path during the tests. Otherwise, this
     # should not be important.
     logger.debug("Reloading the global configuration file.")
-    from ..rc_config import _loadrc
-
-    rc.clear()
-    rc.update(_loadrc())
+    rc.invalidate()
 
 
 @config.command()
 def show():
     """Shows the configuration.
 
-    Displays the content of bob's global configuration file.
+    Displays the content of bob's global configuration, i.e. the site-wide,
+    user and project configuration files merged together with the BOBRC_*
+    environment variables.
     """
+    sources = ["`{}'".format(path) for path in _get_rc_layers()]
+    if _get_env_overrides():
+        sources.append("the environment")
     # always use click.echo instead of print
-    click.echo("Displaying `{}':".format(_get_rc_path()))
+    click.echo("Displaying {}:".format(", ".join(sources)))
     click.echo(_rc_to_str(rc))
 
 
@@ -65,13 +75,51 @@ def get(key):
     click.echo(value)
 
 
+@config.command("list")
+@click.option("-p", "--prefix", help="List the keys starting with PREFIX.")
+@click.option(
+    "-g", "--glob", help="List the keys matching a shell-style pattern."
+)
+@click.option(
+    "-r",
+    "--regex",
+    help="List the keys containing a match of a regular expression.",
+)
+@click.option(
+    "--values",
+    is_flag=True,
+    default=False,
+    help="Print the value of the keys too.",
+)
+def list_command(prefix, glob, regex, values):
+    """Lists the configuration keys.
+
+    Lists the keys of bob's global configuration, optionally filtered. Keys must
+    match all the given filters.
+
+    \b
+    Fails
+    -----
+    * If the regular expression is invalid.
+    """
+    try:
+        keys = rc.search(prefix=prefix, glob=glob, regex=regex)
+    except re.error as e:
+        raise click.BadParameter(str(e), param_hint="--regex")
+    for key in keys:
+        if values:
+            click.echo("{}: {}".format(key, rc[key]))
+        else:
+            click.echo(key)
+
+
 @config.command()
 @click.argument("key")
 @click.argument("value")
 def set(key, value):
     """Sets the value for a key.
 
-    Sets the value of the specified configuration key in bob's global
+    Sets the value of the specified configuration key in the user's
     configuration file.
 
     \b
@@ -88,8 +136,8 @@ def set(key, value):
     * If something goes wrong.
     """
     try:
-        rc[key] = value
-        _saverc(rc)
+        _get_backend().set(key, value)
+        rc.invalidate()
     except Exception:
         logger.error("Could not configure the rc file", exc_info=True)
         raise click.ClickException("Failed to change the configuration.")
@@ -118,7 +166,7 @@ def unset(substr, contain=False, force=False):
 
     Clear all the variables that starts with the provided substring.
     Each key/value pair for which the key starts with substring will be
-    removed from bob's global configuration file.
+    removed from the user's configuration file.
 
     \b
     Arguments
@@ -134,16 +182,13 @@ def unset(substr, contain=False, force=False):
     force : bool
         If set, unset values without confirmation
     """
-    found = False
-    to_delete = []
-    for key in list(rc.keys()):
-        if key.startswith(substr):
-            found = True
-            to_delete.append(key)
-        if contain:
-            if substr in key:
-                to_delete.append(key)
-                found = True
+    backend = _get_backend()
+    # keys starting with substr also contain it
+    if contain:
+        to_delete = backend.search(contains=substr)
+    else:
+        to_delete = backend.search(prefix=substr)
+    found = bool(to_delete)
 
     if not found:
         if not contain:
@@ -161,16 +206,33 @@ def unset(substr, contain=False, force=False):
 
         raise click.ClickException("Failed to change the configuration.")
 
-    if force:
-        for key in to_delete:
-            del rc[key]
-    else:
+    if not force:
         click.echo("Registered for deletion:")
+        values = backend.get_many(to_delete)
         for key in to_delete:
-            click.echo('- "{}" : "{}"'.format(key, rc[key]))
-        delete = click.confirm("Are you sure you want to delete all this ?")
-        if delete:
-            for key in to_delete:
-                del rc[key]
+            click.echo('- "{}" : "{}"'.format(key, values[key]))
+        if not click.confirm("Are you sure you want to delete all this ?"):
+            return
+
+    backend.delete(to_delete)
+    rc.invalidate()
 
-    _saverc(rc)
+
+@config.command("migrate")
+@click.argument("backend", type=click.Choice(sorted(BACKENDS)))
+def migrate_command(backend):
+    """Converts the configuration file to another storage backend.
+
+    The user's configuration file is converted in place, keeping its content.
+    The ``json`` backend (the default) is easy to edit by hand, while the
+    ``sqlite`` backend is faster to query and modify when the file holds many
+    keys.
+
+    \b
+    Arguments
+    ---------
+    backend : str
+        The name of the storage backend to convert to.
+    """
+    migrate(backend)
+    rc.invalidate()
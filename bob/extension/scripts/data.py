@@ -0,0 +1,183 @@
+"""The manager for the files downloaded into bob's data folder.
+"""
+import logging
+import os
+import time
+
+import click
+
+from .. import rc
+from ..artifacts import ENTRY_POINT_GROUP, MANIFEST_KEY, list_artifacts
+from ..artifacts import prefetch as run_prefetch
+from ..artifacts import write_manifest
+from ..data_cache import (
+    QUOTA_KEY,
+    collect_garbage,
+    disk_usage,
+    format_size,
+    pin,
+)
+from ..download import _bob_data_folder
+from .click_helper import AliasedGroup, verbosity_option
+
+logger = logging.getLogger(__name__)
+
+
+@click.group(cls=AliasedGroup)
+@verbosity_option()
+def data(**kwargs):
+    """The manager for the files downloaded into bob's data folder."""
+    pass
+
+
+@data.command()
+def du():
+    """Shows the disk usage of the data folder.
+
+    Displays every file that was downloaded into bob's data folder together with
+    its size (including the files extracted from it) and the time it was last
+    accessed. Pinned entries are marked with a ``*``.
+    """
+    folder = _bob_data_folder()
+    entries = disk_usage()
+    click.echo("Displaying `{}':".format(folder))
+    for key, entry in sorted(entries.items(), key=lambda i: -i[1]["size"]):
+        click.echo(
+            "{:>8} {} {}{}".format(
+                format_size(entry["size"]),
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["atime"])),
+                key,
+                " *" if entry["pinned"] else "",
+            )
+        )
+    total = sum(entry["size"] for entry in entries.values())
+    click.echo("{:>8} total".format(format_size(total)))
+
+
+@data.command()
+@click.option(
+    "-q",
+    "--quota",
+    help="The maximum size of the data folder (e.g. 500M or 20G). Defaults to "
+    "the value of the `bob_data_quota' key of the global configuration.",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Only prints the entries that would be evicted.",
+)
+def gc(quota, dry_run):
+    """Evicts the least recently used files.
+
+    Removes the least recently used files from bob's data folder until its size
+    fits in the quota. Pinned files and files in use by running processes are
+    never removed.
+
+    \b
+    Fails
+    -----
+    * If no quota is given nor configured.
+    """
+    if quota is None and rc.get(QUOTA_KEY) is None:
+        raise click.ClickException(
+            "No quota was given and the `{}' key is not set.".format(QUOTA_KEY)
+        )
+    try:
+        evicted = collect_garbage(quota=quota, dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for key in evicted:
+        click.echo(
+            "{}{}".format("Would evict " if dry_run else "Evicted ", key)
+        )
+
+
+@data.command(name="pin")
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "-u",
+    "--unpin",
+    is_flag=True,
+    default=False,
+    help="Unpins the files instead.",
+)
+def pin_command(paths, unpin):
+    """Pins files so they are never evicted.
+
+    \b
+    Arguments
+    ---------
+    paths : str
+        Paths to the files, absolute or relative to the data folder.
+
+    \b
+    Fails
+    -----
+    * If one of the files does not exist.
+    """
+    folder = _bob_data_folder()
+    for path in paths:
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(folder, path)
+        try:
+            pin(path, pinned=not unpin)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        logger.info("%s `%s'", "Unpinned" if unpin else "Pinned", path)
+
+
+@data.command()
+@click.argument("names", nargs=-1)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.INT,
+    default=4,
+    show_default=True,
+    help="The number of files downloaded at the same time.",
+)
+@click.option(
+    "-o",
+    "--output",
+    help="Where to write the manifest of the downloaded files. Defaults to the "
+    "value of the `bob_data_manifest' key of the global configuration or to "
+    "`manifest.json' in the data folder.",
+)
+@click.option(
+    "--entry-point-group",
+    default=ENTRY_POINT_GROUP,
+    hidden=True,
+)
+def prefetch(names, jobs, output, entry_point_group):
+    """Downloads all declared artifacts.
+
+    Downloads, in parallel, all the files that packages declare through the
+    ``bob.artifacts`` entry point group and writes a manifest of them. Run this
+    command on a machine with network access, then point the compute nodes to
+    the manifest with ``bob config set bob_data_manifest <manifest>``.
+
+    \b
+    Arguments
+    ---------
+    names : str
+        If given, only the artifacts of these entry points are downloaded.
+
+    \b
+    Fails
+    -----
+    * If an artifact cannot be downloaded.
+    """
+    artifacts = list_artifacts(entry_point_group, names=names)
+    click.echo("Prefetching {} file(s)...".format(len(artifacts)))
+    try:
+        manifest = run_prefetch(artifacts, jobs=jobs)
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    output = output or rc.get(MANIFEST_KEY)
+    if output is None:
+        output = os.path.join(_bob_data_folder(), "manifest.json")
+    write_manifest(manifest, os.path.expanduser(output))
+    click.echo("The manifest was written to `{}'".format(output))
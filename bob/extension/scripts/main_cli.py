@@ -1,22 +1,33 @@
 """This is the main entry to bob's scripts.
 """
+import sys
+
 import click
 import pkg_resources
 
 from click_plugins import with_plugins
 
 from ..log import setup
-from .click_helper import AliasedGroup
+from .click_helper import AliasedGroup, DownloadProgressBar, profile_option
 
 logger = setup("bob")
 
+_progress_bar = None
+
 
 @with_plugins(pkg_resources.iter_entry_points("bob.cli"))
 @click.group(
     cls=AliasedGroup,
     context_settings=dict(help_option_names=["-?", "-h", "--help"]),
 )
+@profile_option()
 def main():
     """The main command line interface for bob. Look below for available
     commands."""
-    pass
+    global _progress_bar
+    # show the progress of the downloads when running in a terminal
+    if _progress_bar is None and sys.stderr.isatty():
+        from ..download import add_download_hook
+
+        _progress_bar = DownloadProgressBar()
+        add_download_hook(_progress_bar)
@@ -0,0 +1,233 @@
+"""Tools to inspect the plugins of the bob command.
+"""
+import fnmatch
+import json
+import logging
+import subprocess
+import sys
+
+import click
+import pkg_resources
+
+from ..data_cache import format_size
+from .click_helper import AliasedGroup, verbosity_option
+
+logger = logging.getLogger(__name__)
+
+
+# runs in a fresh interpreter to import one entry point
+_IMPORT_PROFILE_SCRIPT = """
+import importlib, json, os, resource, sys, time
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # the peak resident memory, in bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+module, attrs = sys.argv[1], sys.argv[2:]
+modules, memory = len(sys.modules), rss()
+start = time.perf_counter()
+value = importlib.import_module(module)
+for attr in attrs:
+    value = getattr(value, attr)
+elapsed = time.perf_counter() - start
+# the entry point may have printed something already
+print()
+print(
+    json.dumps(
+        {
+            "time": elapsed,
+            "memory": rss() - memory,
+            "modules": len(sys.modules) - modules,
+        }
+    )
+)
+"""
+
+
+def _expand_entry_point_groups(groups):
+    known = None
+    for group in groups:
+        if not any(c in group for c in "*?["):
+            yield group
+            continue
+        if known is None:
+            known = sorted(
+                {
+                    name
+                    for dist in pkg_resources.working_set
+                    for name in dist.get_entry_map()
+                }
+            )
+        yield from fnmatch.filter(known, group)
+
+
+def profile_entry_points(groups, names=None, timeout=None):
+    """Measures how long it takes to import each entry point of some groups.
+
+    Every entry point is imported in a fresh interpreter, so that the modules
+    imported by one entry point are not shared with the others. This is useful
+    to find out which plugin makes the ``bob`` command slow to start::
+
+        results = profile_entry_points(["bob.cli", "bob.bio.*"])
+
+    Parameters
+    ----------
+    groups : list
+        The entry point groups. Shell-style wildcards (e.g. ``bob.bio.*``) are
+        matched against the groups of the installed packages.
+    names : :obj:`list`, optional
+        If given, only the entry points with these names are imported.
+    timeout : :obj:`float`, optional
+        The maximum time, in seconds, given to the import of one entry point.
+
+    Returns
+    -------
+    list
+        One dictionary per entry point with its ``group``, its ``name``, its
+        ``module``, the wall ``time`` (in seconds) of its import, the increase
+        of the resident ``memory`` (in bytes) of the interpreter, the
+        number of imported ``modules`` and the ``error`` message if the import
+        failed (in which case the measurements are None).
+    """
+    results = []
+    for group in _expand_entry_point_groups(groups):
+        for entry_point in pkg_resources.iter_entry_points(group):
+            if names and entry_point.name not in names:
+                continue
+            result = {
+                "group": group,
+                "name": entry_point.name,
+                "module": entry_point.module_name,
+                "time": None,
+                "memory": None,
+                "modules": None,
+                "error": None,
+            }
+            try:
+                process = subprocess.run(
+                    [sys.executable, "-c", _IMPORT_PROFILE_SCRIPT]
+                    + [entry_point.module_name]
+                    + list(entry_point.attrs),
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                )
+            except subprocess.TimeoutExpired:
+                result["error"] = f"Timed out after {timeout}s"
+            else:
+                if process.returncode == 0:
+                    result.update(json.loads(process.stdout.splitlines()[-1]))
+                else:
+                    lines = process.stderr.strip().splitlines()
+                    result["error"] = lines[-1] if lines else "Failed"
+            results.append(result)
+    return results
+
+
+_SORT_KEYS = {
+    "time": lambda r: -(r["time"] or 0),
+    "memory": lambda r: -(r["memory"] or 0),
+    "modules": lambda r: -(r["modules"] or 0),
+    "name": lambda r: (r["group"], r["name"]),
+}
+
+
+@click.group(cls=AliasedGroup)
+@verbosity_option()
+def plugins(**kwargs):
+    """Tools to inspect the plugins of the bob command."""
+    pass
+
+
+@plugins.command()
+@click.option(
+    "-g",
+    "--entry-point-group",
+    "groups",
+    multiple=True,
+    default=["bob.cli"],
+    show_default=True,
+    help="The entry point groups to profile (e.g. bob.bio.database). "
+    "Shell-style wildcards are allowed (e.g. 'bob.bio.*'). Can be given several "
+    "times.",
+)
+@click.option(
+    "-n",
+    "--name",
+    "names",
+    multiple=True,
+    help="Only profiles the entry points with this name. Can be given several "
+    "times.",
+)
+@click.option(
+    "-s",
+    "--sort",
+    type=click.Choice(sorted(_SORT_KEYS)),
+    default="time",
+    show_default=True,
+    help="How to sort the table.",
+)
+@click.option(
+    "-t",
+    "--timeout",
+    type=click.FLOAT,
+    help="The maximum time (in seconds) given to the import of one entry point.",
+)
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    default=False,
+    help="Prints the measurements in JSON instead of a table.",
+)
+def profile(groups, names, sort, timeout, as_json):
+    """Measures the import time of each plugin.
+
+    Imports every entry point of the given groups in a fresh interpreter and
+    reports the wall time of the import, the increase of the resident memory and
+    the number of imported modules. By default, the commands of the bob script
+    (the ``bob.cli`` entry points) are profiled.
+
+    \b
+    Examples
+    --------
+    $ bob plugins profile
+    $ bob plugins profile -g bob.cli -g 'bob.bio.*' --sort memory
+    """
+    results = profile_entry_points(groups, names=names, timeout=timeout)
+    results.sort(key=_SORT_KEYS[sort])
+    if as_json:
+        click.echo(json.dumps(results, indent=4))
+        return
+    click.echo(
+        "{:>8} {:>8} {:>7}  {}".format(
+            "TIME", "MEMORY", "MODULES", "ENTRY POINT"
+        )
+    )
+    for result in results:
+        entry_point = "{}:{} ({})".format(
+            result["group"], result["name"], result["module"]
+        )
+        if result["error"] is not None:
+            click.echo(
+                "{:>8} {:>8} {:>7}  {}: {}".format(
+                    "-", "-", "-", entry_point, result["error"]
+                )
+            )
+            continue
+        click.echo(
+            "{:>7.3f}s {:>8} {:>7}  {}".format(
+                result["time"],
+                format_size(result["memory"]),
+                result["modules"],
+                entry_point,
+            )
+        )
+    failed = sum(1 for r in results if r["error"] is not None)
+    if failed:
+        logger.warning("%d entry point(s) could not be imported", failed)
@@ -0,0 +1,104 @@
+"""Tests for the registry of downloaded artifacts"""
+
+import json
+import os
+import tempfile
+
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from bob.extension import rc_context
+from bob.extension.artifacts import list_artifacts
+from bob.extension.download import get_file
+from bob.extension.scripts import main_cli
+from bob.extension.scripts.click_helper import assert_click_runner_result
+
+GROUP = "bob.extension.test_artifacts"
+
+
+def test_list_artifacts():
+    artifacts = list_artifacts(GROUP)
+    assert sorted(a["filename"] for a in artifacts) == [
+        "README.rst",
+        "test_list_folders1.tar.gz",
+        "test_list_folders2.tar.gz",
+    ], artifacts
+    artifacts = list_artifacts(GROUP, names=["readme"])
+    assert [a["filename"] for a in artifacts] == ["README.rst"], artifacts
+
+
+def test_prefetch_and_offline():
+    with tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder}
+    ):
+        manifest_path = os.path.join(folder, "manifest.json")
+        runner = CliRunner()
+        result = runner.invoke(
+            main_cli,
+            ["data", "prefetch", "-j", "2", "--entry-point-group", GROUP],
+        )
+        assert_click_runner_result(result)
+        assert os.path.exists(os.path.join(folder, "test", "README.rst"))
+        # the extracted archive
+        assert os.path.isdir(os.path.join(folder, "test", "test_list_folders"))
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        assert sorted(manifest) == [
+            "test/README.rst",
+            "test/test_list_folders1.tar.gz",
+            "test/test_list_folders2.tar.gz",
+        ], manifest
+
+        urls = manifest["test/README.rst"]["urls"]
+        with rc_context(
+            {"bob_data_manifest": manifest_path, "bob_data_offline": "true"}
+        ):
+            # cached files are used without touching the network
+            path = get_file("README.rst", ["http://localhost:1"], "test")
+            assert path == os.path.join(folder, "test", "README.rst")
+
+            # a file which does not match the manifest cannot be fetched again
+            with open(path, "a") as f:
+                f.write("corrupted")
+            try:
+                get_file("README.rst", urls, "test")
+                assert False, "The code above should have raised a RuntimeError"
+            except RuntimeError:
+                pass
+
+            # nor can a missing file
+            try:
+                get_file("missing.txt", urls, "test")
+                assert False, "The code above should have raised a RuntimeError"
+            except RuntimeError:
+                pass
+
+        # without the offline flag, the corrupted file is downloaded again
+        with rc_context({"bob_data_manifest": manifest_path}):
+            path = get_file("README.rst", urls, "test")
+            assert os.path.getsize(path) == manifest["test/README.rst"]["size"]
+
+
+def test_missing_manifest():
+    with tempfile.TemporaryDirectory() as folder, rc_context(
+        {
+            "bob_data_folder": folder,
+            "bob_data_manifest": os.path.join(folder, "manifest.json"),
+        }
+    ):
+        readme = os.path.join(folder, "README.rst")
+        with open(readme, "w") as f:
+            f.write("readme")
+        url = Path(readme).as_uri()
+        # the manifest does not exist before the first prefetch
+        path = get_file("README.rst", [url], "test")
+        assert get_file("README.rst", [url], "test") == path
+
+        with rc_context({"bob_data_offline": "true"}):
+            try:
+                get_file("README.rst", [url], "test")
+                assert False, "The code above should have raised a RuntimeError"
+            except RuntimeError as e:
+                assert "does not exist" in str(e), e
@@ -1,4 +1,7 @@
+import os
+import pstats
 import time
+import tracemalloc
 
 import click
 import pkg_resources
@@ -12,8 +15,11 @@ from bob.extension.scripts.click_helper import (
     assert_click_runner_result,
     bool_option,
     list_float_option,
+    profile_option,
     verbosity_option,
 )
+from bob.extension.scripts.main_cli import main as main_cli
+from bob.extension.scripts.plugins import profile_entry_points
 
 
 def test_verbosity_option():
@@ -233,6 +239,53 @@ def test_config_dump():
         _assert_config_dump(ref, "19/05/2022")
 
 
+def test_config_not_executed_for_help():
+    @click.command(cls=ConfigCommand)
+    @click.option("-a", cls=ResourceOption)
+    def cli(a, **kwargs):
+        click.echo(a)
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("heavy_config.py", "w") as f:
+            f.write("open('executed', 'a').write('x')\na = 1\n")
+
+        for args in (["--help"], ["-H", "TEST_CONF"]):
+            result = runner.invoke(cli, ["heavy_config.py"] + args)
+            assert_click_runner_result(result)
+            assert not os.path.exists("executed"), args
+
+        # the config file is executed once, even if no option looks it up
+        result = runner.invoke(cli, ["heavy_config.py", "-a", "2"])
+        assert_click_runner_result(result)
+        assert result.output == "2\n", result.output
+        result = runner.invoke(cli, ["heavy_config.py"])
+        assert_click_runner_result(result)
+        assert result.output == "1\n", result.output
+        with open("executed") as f:
+            assert f.read() == "xx"
+
+
+def test_lazy_config_values():
+    @click.command(
+        cls=ConfigCommand, entry_point_group="bob.extension.test_config_load"
+    )
+    @click.option("-b", cls=ResourceOption)
+    def cli(b, **kwargs):
+        click.echo(b)
+        timings = click.get_current_context().meta["timings"]
+        phases = [t["phase"] for t in timings]
+        assert phases == ["resolve", "execute", "materialize"], phases
+
+    runner = CliRunner()
+    # the heavy value of the config file is never built
+    result = runner.invoke(
+        cli, ["bob.extension.data.lazy_config"], catch_exceptions=False
+    )
+    assert_click_runner_result(result)
+    assert result.output == "3\n", result.output
+
+
 def test_config_dump2():
     @click.group(cls=AliasedGroup)
     def cli():
@@ -382,3 +435,115 @@ def test_resource_option():
         catch_exceptions=False,
     )
     assert_click_runner_result(result)
+
+
+def test_timings():
+    @click.command(
+        cls=ConfigCommand, entry_point_group="bob.extension.test_config_load"
+    )
+    @click.option(
+        "-r",
+        "--resource",
+        cls=ResourceOption,
+        entry_point_group="bob.extension.test_config_load",
+    )
+    def cli(resource, **kwargs):
+        assert resource == 2, resource
+        timings = click.get_current_context().meta["timings"]
+        click.echo("\n".join("{phase} {name}".format(**t) for t in timings))
+        assert all(t["time"] >= 0 for t in timings), timings
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["basic_config", "-r", "resource2"])
+    assert_click_runner_result(result)
+    lines = result.output.splitlines()
+    # the config files are executed after the options given on the command line
+    assert [line.split()[0] for line in lines] == [
+        "resolve",
+        "execute",
+        "resource",
+        "resolve",
+        "execute",
+    ], result.output
+    assert lines[2] == "resource resource", lines
+    assert lines[4].endswith("basic_config.py"), lines
+
+
+def test_profile_option():
+    @click.group(cls=AliasedGroup)
+    @profile_option()
+    def cli():
+        pass
+
+    @cli.command()
+    @click.argument("n", type=int)
+    def allocate(n):
+        click.echo(len([str(i) for i in range(n)]))
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        # the value of --profile is optional, even before a sub-command
+        result = runner.invoke(cli, ["--profile", "allocate", "1000"])
+        assert_click_runner_result(result)
+        assert result.output.startswith("1000\n"), result.output
+        assert "function calls" in result.output, result.output
+        (output,) = [f for f in os.listdir() if f.endswith(".prof")]
+        stats = pstats.Stats(output)
+        assert any(f[2] == "allocate" for f in stats.stats), stats.stats
+
+        result = runner.invoke(
+            cli,
+            [
+                "--profile=tracemalloc",
+                "--profile-output",
+                "memory",
+                "allocate",
+                "10000",
+            ],
+        )
+        assert_click_runner_result(result)
+        assert "MiB at the peak" in result.output, result.output
+        snapshot = tracemalloc.Snapshot.load("memory")
+        assert snapshot.statistics("filename")
+
+        result = runner.invoke(cli, ["--profile=heap", "allocate", "1"])
+        assert_click_runner_result(result, exit_code=2)
+
+        result = runner.invoke(
+            cli, ["--profile-output", "out", "--profile", "allocate", "10"]
+        )
+        assert_click_runner_result(result)
+        assert pstats.Stats("out").stats
+
+        # every bob command can be profiled
+        result = runner.invoke(
+            main_cli,
+            ["--profile", "--profile-output", "bob.prof", "config", "-h"],
+        )
+        assert_click_runner_result(result)
+        assert os.path.exists("bob.prof")
+
+
+def test_profile_entry_points():
+    results = profile_entry_points(
+        ["bob.extension.test_config_*"], names=["basic_config", "resource2"]
+    )
+    assert sorted((r["group"], r["name"]) for r in results) == [
+        ("bob.extension.test_config_load", "basic_config"),
+        ("bob.extension.test_config_load", "resource2"),
+    ], results
+    for result in results:
+        assert result["error"] is None, result
+        assert result["time"] > 0
+        assert result["modules"] >= 1
+
+    runner = CliRunner()
+    result = runner.invoke(
+        main_cli,
+        ["plugins", "profile", "-g", "bob.cli", "-n", "config", "-s", "name"],
+    )
+    assert_click_runner_result(result)
+    lines = result.output.splitlines()
+    assert lines[0].split() == ["TIME", "MEMORY", "MODULES", "ENTRY", "POINT"]
+    assert len(lines) == 2, result.output
+    assert lines[1].endswith("bob.cli:config (bob.extension.scripts.config)")
@@ -94,3 +94,188 @@ def test_load_resource():
         assert False, "The code above should have raised an ImportError"
     except ImportError:
         pass
+
+
+def test_lazy_values():
+    from .config import LazyValue, materialize
+
+    c = load([os.path.join(path, "lazy_config.py")])
+    assert isinstance(c.heavy, LazyValue)
+    assert materialize(c.b) == 3
+    assert c.a.get() == 1
+    assert materialize(4) == 4
+    assert isinstance(mod_to_context(c)["a"], LazyValue)
+
+    # only the requested value is built
+    group = "bob.extension.test_config_load"
+    value = load(
+        ["bob.extension.data.lazy_config"],
+        entry_point_group=group,
+        attribute_name="b",
+    )
+    assert value == 3
+
+
+def test_reload():
+    import tempfile
+
+    from .config import reload
+
+    def write(path, text):
+        with open(path, "wt") as f:
+            f.write(text)
+        # make sure that the modification is detected
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    with tempfile.TemporaryDirectory() as folder:
+        a, b, c = (os.path.join(folder, f"{n}.py") for n in "abc")
+        write(a, "log.append('a')\nx = 1\ny = 10\n")
+        write(b, "log.append('b')\nz = x + 1\n")
+        write(c, "log.append('c')\nw = y * 2\ndel z\n")
+
+        log = []
+        mod = load([a, b, c], context={"log": log})
+        assert log == ["a", "b", "c"]
+        assert (mod.x, mod.y, mod.w) == (1, 10, 20)
+        assert not hasattr(mod, "z")
+
+        # nothing changed
+        mod = reload(mod)
+        assert log == ["a", "b", "c"]
+        assert (mod.x, mod.y, mod.w) == (1, 10, 20)
+        assert not hasattr(mod, "z")
+
+        # only the last file changed
+        write(c, "log.append('c')\nw = y * 3\n")
+        mod = reload(mod)
+        assert log == ["a", "b", "c", "c"]
+        assert (mod.z, mod.w) == (2, 30)
+
+        # b depends on x but c does not
+        write(a, "log.append('a')\nx = 5\ny = 10\n")
+        mod = reload(mod)
+        assert log == ["a", "b", "c", "c", "a", "b"]
+        assert (mod.x, mod.z, mod.w) == (5, 6, 30)
+        assert mod_to_context(mod) == {
+            "log": log,
+            "x": 5,
+            "y": 10,
+            "z": 6,
+            "w": 30,
+        }
+
+        # a new initial context
+        log2 = []
+        mod = reload(mod, context={"log": log2})
+        assert log2 == ["a", "b", "c"]
+
+        # the objects modified in place are created again
+        write(a, "log.append('a')\nlst = []\n")
+        write(b, "log.append('b')\nlst.append(1)\n")
+        write(c, "log.append('c')\nn = 1\n")
+        log = []
+        old = load([a, b, c], context={"log": log})
+        write(b, "log.append('b')\nlst.append(1)\n")
+        mod = reload(old)
+        assert log == ["a", "b", "c", "a", "b"]
+        assert mod.lst == [1]
+        assert old.lst == [1]
+        assert mod.lst is not old.lst
+
+    try:
+        reload(load([]))
+        assert False, "The code above should have raised a ValueError"
+    except ValueError:
+        pass
+
+
+def test_introspect():
+    from .config import introspect
+
+    group = "bob.extension.test_config_load"
+    results = introspect(
+        ["basic_config", "bob.extension.data.load_config"],
+        entry_point_group=group,
+    )
+    assert [os.path.basename(r["path"]) for r in results] == [
+        "basic_config.py",
+        "load_config.py",
+    ]
+    assert results[0]["defines"] == ["a", "b"]
+    assert results[1]["defines"] == ["b", "c"]
+    assert results[1]["overrides"] == ["b"]
+    assert results[1]["reads"] == ["b"]
+
+    (result,) = introspect([os.path.join(path, "config_with_module.py")])
+    assert result["defines"] == ["numpy", "return_zeros"], result
+    assert result["imports"] == ["numpy"], result
+    assert result["overrides"] == []
+
+
+def test_module_path_resolution_does_not_import_parents():
+    import sys
+    import tempfile
+
+    from .config import _get_module_filename
+
+    with tempfile.TemporaryDirectory() as folder:
+        package = os.path.join(folder, "bob_heavy_package", "config")
+        os.makedirs(package)
+        for init in (package, os.path.dirname(package)):
+            with open(os.path.join(init, "__init__.py"), "w") as f:
+                f.write("raise RuntimeError('The package was imported')\n")
+        with open(os.path.join(package, "light.py"), "w") as f:
+            f.write("a = 1\n")
+
+        sys.path.insert(0, folder)
+        try:
+            value = load(
+                ["bob_heavy_package.config.light"],
+                entry_point_group="bob.extension.test_config_load",
+                attribute_name="a",
+            )
+            assert value == 1
+            assert "bob_heavy_package" not in sys.modules
+            assert _get_module_filename(
+                "bob_heavy_package.config.light"
+            ) == os.path.join(package, "light.py")
+        finally:
+            sys.path.remove(folder)
+    assert _get_module_filename("bob.extension.data.basic_config").endswith(
+        os.path.join("data", "basic_config.py")
+    )
+    assert _get_module_filename("bob.extension.data.missing") == ""
+
+    # packages split across several sys.path entries with pkgutil.extend_path
+    extend_path = (
+        "__path__ = __import__('pkgutil').extend_path(__path__, __name__)\n"
+    )
+    with tempfile.TemporaryDirectory() as folder1, tempfile.TemporaryDirectory() as folder2:
+        for folder in (folder1, folder2):
+            package = os.path.join(folder, "bob_split_package", "ns")
+            os.makedirs(package)
+            for init in (package, os.path.dirname(package)):
+                with open(os.path.join(init, "__init__.py"), "w") as f:
+                    f.write(extend_path)
+        config = os.path.join(folder2, "bob_split_package", "ns", "conf.py")
+        with open(config, "w") as f:
+            f.write("a = 1\n")
+
+        sys.path[:0] = [folder1, folder2]
+        try:
+            module_name = "bob_split_package.ns.conf"
+            assert _get_module_filename(module_name) == config
+            assert "bob_split_package" not in sys.modules
+            # a module that is not found yet is not memoized
+            assert _get_module_filename("bob_split_package.ns.other") == ""
+            with open(os.path.join(os.path.dirname(config), "other.py"), "w"):
+                pass
+            assert _get_module_filename("bob_split_package.ns.other").endswith(
+                "other.py"
+            )
+        finally:
+            del sys.path[:2]
+            for name in list(sys.modules):
+                if name.startswith("bob_split_package"):
+                    del sys.modules[name]
@@ -0,0 +1,125 @@
+"""Tests for the size-bounded management of the data folder"""
+
+import os
+import tempfile
+import time
+
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from bob.extension import rc_context
+from bob.extension.data_cache import (
+    collect_garbage,
+    disk_usage,
+    entry_lock,
+    parse_size,
+    pin,
+)
+from bob.extension.download import get_file
+from bob.extension.scripts import main_cli
+from bob.extension.scripts.click_helper import assert_click_runner_result
+
+
+def _make_files(directory, sizes):
+    urls = {}
+    for name, size in sizes.items():
+        path = Path(directory) / name
+        path.write_bytes(b"0" * size)
+        urls[name] = [path.as_uri()]
+    return urls
+
+
+def test_parse_size():
+    assert parse_size(None) is None
+    assert parse_size(10) == 10
+    assert parse_size("10") == 10
+    assert parse_size("1K") == 1024
+    assert parse_size("1.5M") == 1.5 * 1024**2
+    assert parse_size("2GiB") == 2 * 1024**3
+    try:
+        parse_size("a lot")
+        assert False, "The code above should have raised a ValueError"
+    except ValueError:
+        pass
+
+
+def test_lru_eviction():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder, "bob_data_quota": "1G"}
+    ):
+        urls = _make_files(remote, {"a": 100, "b": 200, "c": 300})
+        for name in ("a", "b", "c"):
+            get_file(name, urls[name], cache_subdir="test")
+        # a is used again, so b becomes the least recently used
+        time.sleep(0.01)
+        get_file("a", urls["a"], cache_subdir="test")
+
+        usage = disk_usage()
+        assert sorted(usage) == ["test/a", "test/b", "test/c"], usage
+        assert usage["test/b"]["size"] == 200
+        assert usage["test/a"]["atime"] > usage["test/c"]["atime"], usage
+
+        assert collect_garbage(quota="1G") == []
+        assert collect_garbage(quota=450, dry_run=True) == ["test/b"]
+        assert os.path.exists(os.path.join(folder, "test", "b"))
+
+        # pinned and locked entries are skipped
+        pin(os.path.join(folder, "test", "b"))
+        with entry_lock(os.path.join(folder, "test", "c")):
+            assert collect_garbage(quota=450) == ["test/a"]
+        assert sorted(disk_usage()) == ["test/b", "test/c"]
+
+        # the quota is enforced by get_file
+        with rc_context({"bob_data_quota": "400"}):
+            get_file("a", urls["a"], cache_subdir="test")
+        assert sorted(disk_usage()) == ["test/a", "test/b"]
+
+
+def test_bob_data():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder}
+    ):
+        urls = _make_files(remote, {"a": 100, "b": 200})
+        get_file("a", urls["a"], cache_subdir="test")
+        get_file("b", urls["b"], cache_subdir="test")
+
+        runner = CliRunner()
+        result = runner.invoke(main_cli, ["data", "du"])
+        assert_click_runner_result(result)
+        assert "test/a" in result.output, result.output
+        assert "300B total" in result.output, result.output
+
+        result = runner.invoke(main_cli, ["data", "gc"])
+        assert_click_runner_result(result, exit_code=1)
+
+        result = runner.invoke(main_cli, ["data", "pin", "test/a"])
+        assert_click_runner_result(result)
+        result = runner.invoke(main_cli, ["data", "gc", "--quota", "10"])
+        assert_click_runner_result(result)
+        assert result.output == "Evicted test/b\n", result.output
+
+        result = runner.invoke(main_cli, ["data", "pin", "test/b"])
+        assert_click_runner_result(result, exit_code=1)
+
+
+def test_cache_hits_do_not_rewrite_the_index():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder}
+    ):
+        urls = _make_files(remote, {"a": 100})
+        get_file("a", urls["a"], cache_subdir="test")
+        index = os.path.join(folder, ".bob_data_index.json")
+        mtime = os.stat(index).st_mtime_ns
+        atime = os.stat(os.path.join(folder, "test", "a")).st_atime_ns
+
+        time.sleep(0.01)
+        get_file("a", urls["a"], cache_subdir="test")
+        assert os.stat(index).st_mtime_ns == mtime
+        # without a quota, the hits are not recorded at all
+        assert os.stat(os.path.join(folder, "test", "a")).st_atime_ns == atime
+
+        with rc_context({"bob_data_quota": "1G"}):
+            get_file("a", urls["a"], cache_subdir="test")
+        assert os.stat(index).st_mtime_ns == mtime
+        assert os.stat(os.path.join(folder, "test", "a")).st_atime_ns > atime
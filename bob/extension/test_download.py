@@ -1,18 +1,41 @@
+import contextlib
+import functools
+import http.server
+import io
+import json
+import logging
 import os
 import shutil
 import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.error import HTTPError
 
 import pkg_resources
 
 from bob.extension import rc_context
 from bob.extension.download import (
+    HTTPTransport,
+    LocalDirectoryTransport,
+    _hash_file,
     _untar,
+    add_download_hook,
     download_and_unzip,
+    download_file,
     find_element_in_tarball,
     get_file,
     list_dir,
+    register_transport,
+    remove_download_hook,
     search_file,
 )
+from bob.extension.rc_config import with_rc_context
+from bob.extension.scripts.click_helper import DownloadProgressBar
+
+logger = logging.getLogger(__name__)
 
 
 def test_download_unzip():
@@ -166,3 +189,309 @@ def test_list_dir():
         assert fldrs == [], (fldrs, root_folder)
         fldrs = list_dir(root_folder, "database1/protocol1", folders=False)
         assert fldrs == ["dev.csv", "train.csv"], (fldrs, root_folder)
+
+
+def test_get_file_tiers():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as local, tempfile.TemporaryDirectory() as shared:
+        source = Path(remote) / "file.txt"
+        source.write_text("content")
+        urls = [source.as_uri()]
+        local_path = os.path.join(local, "test", "file.txt")
+        shared_path = os.path.join(shared, "test", "file.txt")
+
+        with rc_context({"bob_data_folder": shared, "bob_data_tiers": local}):
+            # downloads into the shared tier and promotes to the local one
+            assert get_file("file.txt", urls, cache_subdir="test") == local_path
+            assert open(shared_path).read() == "content"
+            assert open(local_path).read() == "content"
+            assert not [f for f in os.listdir(local) if ".part" in f]
+
+            # a file missing in the local tier is copied from the shared one
+            # without touching the urls
+            os.remove(local_path)
+            source.unlink()
+            assert get_file("file.txt", urls, cache_subdir="test") == local_path
+            assert open(local_path).read() == "content"
+
+        with rc_context(
+            {
+                "bob_data_folder": shared,
+                "bob_data_tiers": local,
+                "bob_data_tiers_promote": "false",
+            }
+        ):
+            os.remove(local_path)
+            path = get_file("file.txt", urls, cache_subdir="test")
+            assert path == shared_path
+            assert not os.path.exists(local_path)
+
+        # files evicted from the local tier are demoted to the shared one
+        source.write_text("content")
+        with rc_context(
+            {
+                "bob_data_folder": shared,
+                "bob_data_tiers": local,
+                "bob_data_tiers_download": "local",
+                "bob_data_tiers_quota": "1",
+                "bob_data_tiers_demote": "true",
+            }
+        ):
+            os.remove(shared_path)
+            assert get_file("file.txt", urls, cache_subdir="test") == local_path
+            assert not os.path.exists(shared_path)
+            get_file("other.txt", urls, cache_subdir="test")
+            assert not os.path.exists(local_path)
+            assert open(shared_path).read() == "content"
+
+
+class _CountingHandler(http.server.SimpleHTTPRequestHandler):
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(0.05)
+            super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _http_server(directory, handler=_CountingHandler):
+    """A local stand-in for a remote HTTP server"""
+    handler = functools.partial(handler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:%d" % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_throttling():
+    size = 256 * 1024
+    rate = 1024 * 1024
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as tmpdir, _http_server(
+        remote
+    ) as url:
+        with open(os.path.join(remote, "file.bin"), "wb") as f:
+            f.write(os.urandom(size))
+
+        out_files = [os.path.join(tmpdir, f"file{i}.bin") for i in range(4)]
+        lockdir = {"bob_data_download_lockdir": os.path.join(tmpdir, "locks")}
+
+        # all downloads share the bandwidth
+        with rc_context(dict(lockdir, bob_data_download_rate=rate)):
+            start = time.monotonic()
+            with ThreadPoolExecutor(4) as executor:
+                list(
+                    executor.map(
+                        with_rc_context(
+                            lambda f: download_file(url + "/file.bin", f)
+                        ),
+                        out_files,
+                    )
+                )
+            elapsed = time.monotonic() - start
+        throughput = 4 * size / elapsed
+        logger.info("Throttled throughput: %.2f MiB/s", throughput / 1024**2)
+        assert throughput < 1.1 * rate, throughput
+        for out_file in out_files:
+            assert os.path.getsize(out_file) == size
+
+        # at most one connection at a time
+        _CountingHandler.max_active = 0
+        with rc_context(dict(lockdir, bob_data_download_connections=1)):
+            with ThreadPoolExecutor(4) as executor:
+                list(
+                    executor.map(
+                        with_rc_context(
+                            lambda f: download_file(url + "/file.bin", f)
+                        ),
+                        out_files,
+                    )
+                )
+        assert _CountingHandler.max_active == 1, _CountingHandler.max_active
+
+        # 0 means no limit
+        with rc_context(
+            dict(
+                lockdir,
+                bob_data_download_rate="0",
+                bob_data_download_connections=0,
+            )
+        ):
+            download_file(url + "/file.bin", out_files[0])
+        assert os.path.getsize(out_files[0]) == size
+
+
+class _KeepAliveHandler(_CountingHandler):
+    protocol_version = "HTTP/1.1"
+    clients = set()
+    failures = 0
+
+    def do_GET(self):
+        type(self).clients.add(self.client_address)
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_error(503)
+            return
+        super().do_GET()
+
+
+class _IdleTimeoutHandler(_KeepAliveHandler):
+    # closes the connections that stay idle for more than 0.2s
+    timeout = 0.2
+    clients = set()
+
+
+def test_transports_idle_timeout():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as tmpdir, _http_server(
+        remote, _IdleTimeoutHandler
+    ) as url:
+        with open(os.path.join(remote, "protocol.csv"), "w") as f:
+            f.write("protocol\n")
+        out_file = os.path.join(tmpdir, "out.csv")
+
+        # reconnecting after the server closed an idle connection is neither
+        # an attempt nor delayed by the backoff
+        transport = HTTPTransport(retries=0, backoff=10)
+        old = register_transport("http", transport)
+        try:
+            for _ in range(3):
+                start = time.monotonic()
+                download_file(f"{url}/protocol.csv", out_file)
+                assert time.monotonic() - start < 1
+                assert open(out_file).read() == "protocol\n"
+                time.sleep(0.4)
+        finally:
+            register_transport("http", old)
+            transport.close()
+
+
+def test_transports():
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as tmpdir, _http_server(
+        remote, _KeepAliveHandler
+    ) as url:
+        for i in range(5):
+            with open(os.path.join(remote, f"protocol{i}.csv"), "w") as f:
+                f.write(f"protocol {i}\n")
+        out_file = os.path.join(tmpdir, "out.csv")
+
+        # small files from the same host reuse the same connection
+        for i in range(5):
+            download_file(f"{url}/protocol{i}.csv", out_file)
+            assert open(out_file).read() == f"protocol {i}\n"
+        assert len(_KeepAliveHandler.clients) == 1, _KeepAliveHandler.clients
+
+        # server errors are retried
+        _KeepAliveHandler.failures = 2
+        with rc_context({"bob_data_download_backoff": 0}):
+            download_file(f"{url}/protocol1.csv", out_file)
+        assert open(out_file).read() == "protocol 1\n"
+
+        # client errors are not
+        transport = HTTPTransport(retries=5, backoff=0)
+        try:
+            transport.open(f"{url}/missing.csv")
+            assert False, "The code above should have raised an HTTPError"
+        except HTTPError as e:
+            assert e.code == 404, e
+        transport.close()
+
+        # file:// urls
+        download_file(Path(remote, "protocol2.csv").as_uri(), out_file)
+        assert open(out_file).read() == "protocol 2\n"
+
+        # local mirrors take precedence over the network
+        mirror = os.path.join(tmpdir, "mirror")
+        os.makedirs(os.path.join(mirror, "example.com", "data"))
+        with open(
+            os.path.join(mirror, "example.com", "data", "a.csv"), "w"
+        ) as f:
+            f.write("mirrored\n")
+        with rc_context({"bob_data_mirror": mirror}):
+            download_file("https://example.com/data/a.csv", out_file)
+            assert open(out_file).read() == "mirrored\n"
+            download_file(f"{url}/protocol3.csv", out_file)
+            assert open(out_file).read() == "protocol 3\n"
+
+        old = register_transport("https", LocalDirectoryTransport(mirror))
+        try:
+            download_file("https://example.com/data/a.csv", out_file)
+            assert open(out_file).read() == "mirrored\n"
+        finally:
+            register_transport("https", old)
+
+
+def test_download_hooks():
+    filename = pkg_resources.resource_filename(
+        __name__, "data/test_list_folders1.tar.gz"
+    )
+    urls = [Path(filename).as_uri()]
+    file_hash = _hash_file(filename, "md5")
+    events = []
+
+    def hook(event, info):
+        events.append((event, info))
+
+    with tempfile.TemporaryDirectory() as folder, rc_context(
+        {
+            "bob_data_folder": folder,
+            "bob_data_metrics": os.path.join(folder, "metrics.jsonl"),
+        }
+    ):
+        add_download_hook(hook)
+        try:
+            get_file(
+                "folders.tar.gz",
+                urls,
+                cache_subdir="test",
+                file_hash=file_hash,
+                extract=True,
+            )
+        finally:
+            remove_download_hook(hook)
+
+        names = [e for e, _ in events]
+        assert names[0] == "download_start", names
+        assert names.count("download_end") == 1, names
+        # the downloaded file is validated before being extracted
+        assert names[names.index("download_end") + 1] == "hash", names
+        assert names[-1] == "get_file", names
+        end = dict(events)["download_end"]
+        assert end["bytes"] == os.path.getsize(filename), end
+        members = [i["member"] for e, i in events if e == "extract_member"]
+        assert "test_list_folders/database1/protocol1/dev.csv" in members
+        assert dict(events)["get_file"]["downloaded"]
+
+        # the same events, but the progress, are recorded in the metrics file
+        with open(os.path.join(folder, "metrics.jsonl")) as f:
+            records = [json.loads(line) for line in f]
+        assert [r["event"] for r in records] == [
+            e for e in names if e != "download_progress"
+        ]
+        assert all(r["pid"] == os.getpid() for r in records)
+
+
+def test_download_progress_bar():
+    output = io.StringIO()
+    bar = DownloadProgressBar(file=output)
+    info = {"url": "http://a/b.zip", "path": "/tmp/b.zip"}
+    bar("download_start", dict(info, total=100))
+    bar("download_progress", dict(info, bytes=50, total=100, elapsed=1))
+    bar("download_progress", dict(info, bytes=100, total=100, elapsed=2))
+    bar("download_end", dict(info, bytes=100, elapsed=2))
+    assert bar._bar is None
+    assert not bar._received
@@ -0,0 +1,193 @@
+"""Tests for the asynchronous download functions"""
+
+import asyncio
+import os
+import tempfile
+
+from pathlib import Path
+
+from bob.extension import rc_context
+from bob.extension.download import get_file
+from bob.extension.download_async import (
+    adownload_file,
+    adownload_file_from_possible_urls,
+    aget_file,
+)
+
+
+class _Server:
+    """A local asyncio stand-in for a remote HTTP server.
+
+    Files ending in ``.chunked`` are sent with the chunked transfer encoding
+    and ``/stall`` sends half of its content before hanging.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def handle(self, reader, writer):
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            path = request.split()[1].decode()
+            await asyncio.sleep(0.05)
+            if path == "/redirect":
+                writer.write(
+                    b"HTTP/1.1 302 Found\r\nLocation: /a.bin\r\n"
+                    b"Content-Length: 0\r\n\r\n"
+                )
+            elif path == "/stall":
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n")
+                writer.write(b"01234")
+                await writer.drain()
+                await asyncio.sleep(3600)
+            elif path not in self.files:
+                writer.write(
+                    b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n"
+                )
+            elif path.endswith(".chunked"):
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                )
+                content = self.files[path]
+                for i in range(0, len(content), 1000):
+                    chunk = content[i : i + 1000]
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                writer.write(b"0\r\n\r\n")
+            else:
+                content = self.files[path]
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s"
+                    % (len(content), content)
+                )
+            await writer.drain()
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return "http://127.0.0.1:%d" % port
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def test_adownload_file():
+    files = {
+        "/a.bin": os.urandom(100000),
+        "/b.chunked": os.urandom(5500),
+    }
+
+    async def main(tmpdir):
+        server = _Server(files)
+        async with server as url:
+            out_file = os.path.join(tmpdir, "a.bin")
+            await adownload_file(url + "/a.bin", out_file)
+            assert open(out_file, "rb").read() == files["/a.bin"]
+
+            out_file = os.path.join(tmpdir, "b.bin")
+            await adownload_file(url + "/b.chunked", out_file)
+            assert open(out_file, "rb").read() == files["/b.chunked"]
+
+            out_file = os.path.join(tmpdir, "c.bin")
+            await adownload_file_from_possible_urls(
+                [url + "/missing", url + "/redirect"], out_file
+            )
+            assert open(out_file, "rb").read() == files["/a.bin"]
+
+            try:
+                await adownload_file_from_possible_urls(
+                    [url + "/missing"], out_file
+                )
+                assert False, "The code above should have raised a RuntimeError"
+            except RuntimeError:
+                pass
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(main(tmpdir))
+
+
+def test_aget_file_concurrent_and_cancel():
+    files = {f"/file{i}.bin": os.urandom(10000) for i in range(8)}
+
+    async def main(folder):
+        server = _Server(files)
+        async with server as url:
+            paths = await asyncio.gather(
+                *(
+                    aget_file(name[1:], [url + name], cache_subdir="test")
+                    for name in files
+                )
+            )
+            for name, path in zip(files, paths):
+                assert path == os.path.join(folder, "test", name[1:])
+                assert open(path, "rb").read() == files[name]
+            # all files were downloaded at the same time
+            assert server.max_active == len(files), server.max_active
+
+            # cached files are not downloaded again
+            requests = server.requests
+            await aget_file("file0.bin", [url + "/file0.bin"], "test")
+            assert server.requests == requests
+
+            # cancelling a download leaves no partial file behind
+            task = asyncio.create_task(
+                aget_file("stall.bin", [url + "/stall"], cache_subdir="test")
+            )
+            await asyncio.sleep(0.3)
+            task.cancel()
+            try:
+                await task
+                assert False, "The task should have been cancelled"
+            except asyncio.CancelledError:
+                pass
+            leftovers = [f for f in os.listdir(os.path.join(folder, "test"))]
+            assert sorted(leftovers) == sorted(n[1:] for n in files), leftovers
+
+    with tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder}
+    ):
+        asyncio.run(main(folder))
+        # the lock of the cancelled download was released
+        source = Path(folder, "test", "file1.bin")
+        path = get_file("stall.bin", [source.as_uri()], "test")
+        assert open(path, "rb").read() == files["/file1.bin"]
+
+
+def test_aget_file_same_file():
+    from concurrent.futures import ThreadPoolExecutor
+
+    files = {"/a.bin": os.urandom(100000)}
+
+    async def main(folder):
+        # fewer executor threads than calls
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=2)
+        )
+        server = _Server(files)
+        async with server as url:
+            paths = await asyncio.wait_for(
+                asyncio.gather(
+                    *(aget_file("a.bin", [url + "/a.bin"]) for _ in range(3))
+                ),
+                timeout=30,
+            )
+        assert len(set(paths)) == 1, paths
+        assert open(paths[0], "rb").read() == files["/a.bin"]
+        # the file was only downloaded once
+        assert server.requests == 1, server.requests
+
+    with tempfile.TemporaryDirectory() as folder, rc_context(
+        {"bob_data_folder": folder}
+    ):
+        asyncio.run(main(folder))
@@ -0,0 +1,337 @@
+"""Tests for the set-up of Bob's loggers"""
+
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+from . import log
+
+
+class _SlowStream(io.StringIO):
+    """A stream that blocks until it is released, like a stalled terminal."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, s):
+        self.released.wait(10)
+        return super().write(s)
+
+
+class _ThreadRecordingFormatter(logging.Formatter):
+    threads = set()
+
+    def format(self, record):
+        self.threads.add(threading.current_thread().name)
+        return super().format(record)
+
+
+def _capture(stdout, stderr):
+    old = log._debug_info.stream, log._warn_err.stream
+    log._debug_info.setStream(stdout)
+    log._warn_err.setStream(stderr)
+    return old
+
+
+def test_asynchronous_logging():
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_streams = _capture(stdout, stderr)
+    old_level = logging.getLogger("bob").level
+    try:
+        logger = log.setup(
+            "bob.test_log", format="%(message)s", asynchronous=True
+        )
+        formatter = _ThreadRecordingFormatter("%(message)s")
+        log._debug_info.setFormatter(formatter)
+        log._warn_err.setFormatter(formatter)
+        log.set_verbosity_level(logger, 2)
+        for i in range(100):
+            logger.info("sample %d", i)
+        logger.debug("not shown")
+        logger.warning("warning")
+        log.flush()
+        assert stdout.getvalue() == "".join(f"sample {i}\n" for i in range(100))
+        assert stderr.getvalue() == "warning\n"
+        # the records were formatted in the background
+        assert threading.current_thread().name not in formatter.threads
+
+        # non-bob loggers use the queue too
+        other = log.setup("test_log_other", format="%(message)s")
+        other.setLevel(logging.INFO)
+        other.info("other")
+        log.flush()
+        assert stdout.getvalue().endswith("sample 99\nother\n")
+
+        log.setup("bob.test_log", format="%(message)s", asynchronous=False)
+        assert log._listener is None
+        logger.info("synchronous")
+        assert stdout.getvalue().endswith("other\nsynchronous\n")
+        assert logging.getLogger("test_log_other").handlers == [
+            log._warn_err,
+            log._debug_info,
+        ]
+    finally:
+        log._stop_listener()
+        _capture(*old_streams)
+        logging.getLogger("bob").setLevel(old_level)
+
+
+def test_asynchronous_logging_overflow():
+    stdout, stderr = _SlowStream(), io.StringIO()
+    old_streams = _capture(stdout, stderr)
+    old_level = logging.getLogger("bob").level
+    try:
+        try:
+            log.setup("bob.test_log", asynchronous=True, overflow="discard")
+            assert False, "The code above should have raised a ValueError"
+        except ValueError:
+            pass
+
+        logger = log.setup(
+            "bob.test_log",
+            format="%(message)s",
+            asynchronous=True,
+            queue_size=2,
+            overflow="drop",
+        )
+        log.set_verbosity_level(logger, 2)
+        # the writing thread is stuck, yet logging does not block
+        for i in range(10):
+            logger.info("sample %d", i)
+        dropped = log._queue_handler.dropped
+        assert dropped >= 7, dropped
+        stdout.released.set()
+        log._stop_listener()
+        assert len(stdout.getvalue().splitlines()) == 10 - dropped
+        assert f"{dropped} log records were dropped" in stderr.getvalue()
+    finally:
+        stdout.released.set()
+        log._stop_listener()
+        _capture(*old_streams)
+        logging.getLogger("bob").setLevel(old_level)
+
+
+def test_asynchronous_logging_arguments():
+    stdout, stderr = _SlowStream(), _SlowStream()
+    old_streams = _capture(stdout, stderr)
+    old_level = logging.getLogger("bob").level
+    try:
+        logger = log.setup(
+            "bob.test_log", format="%(message)s", asynchronous=True
+        )
+        log.set_verbosity_level(logger, 2)
+        # the messages are built before the arguments change, although the
+        # writing thread is stuck
+        state = [0]
+        for i in range(1, 4):
+            state[0] = i
+            logger.info("state is %s", state)
+        try:
+            raise ValueError("failure")
+        except ValueError:
+            logger.exception("caught")
+        stdout.released.set()
+        stderr.released.set()
+        log.flush()
+        assert stdout.getvalue().splitlines() == [
+            "state is [1]",
+            "state is [2]",
+            "state is [3]",
+        ]
+        assert stderr.getvalue().startswith("caught\nTraceback")
+        assert stderr.getvalue().endswith("ValueError: failure\n")
+    finally:
+        stdout.released.set()
+        stderr.released.set()
+        log._stop_listener()
+        _capture(*old_streams)
+        logging.getLogger("bob").setLevel(old_level)
+
+
+def _work(n):
+    logger = logging.getLogger("bob.test_log")
+    for i in range(n):
+        logger.info("line %d of a worker", i)
+    return n
+
+
+def _wait_for_lines(stream, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        lines = stream.getvalue().splitlines()
+        if len(lines) >= count:
+            return lines
+        time.sleep(0.01)
+    return stream.getvalue().splitlines()
+
+
+def test_log_aggregation():
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_streams = _capture(stdout, stderr)
+    old_level = logging.getLogger("bob").level
+    try:
+        logger = log.setup("bob.test_log", format="%(message)s", aggregate=True)
+        log.set_verbosity_level(logger, 2)
+        logger.info("parent")
+        # the address is not leaked to all subprocesses
+        address = log.aggregator_address().split(":", 1)[1]
+        assert not any(address in v for v in os.environ.values())
+
+        # forked workers are set up automatically
+        with multiprocessing.get_context("fork").Pool(2) as pool:
+            assert sum(pool.map(_work, [100] * 4)) == 400
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+            2,
+            initializer=log.init_worker,
+            initargs=(log.aggregator_address(),),
+        ) as pool:
+            assert sum(pool.map(_work, [100] * 4)) == 400
+
+        lines = _wait_for_lines(stdout, 801)
+        assert lines[0] == "parent"
+        # each line is written once and untorn
+        assert len(lines) == 801, len(lines)
+        for line in lines[1:]:
+            assert re.fullmatch(
+                r"\[(Fork|Spawn)PoolWorker-\d+\[\d+\]\] line \d+ of a worker",
+                line,
+            ), line
+        assert sum("Spawn" in line for line in lines) == 400
+    finally:
+        log._stop_aggregator()
+        _capture(*old_streams)
+        logging.getLogger("bob").setLevel(old_level)
+    assert log.aggregator_address() is None
+    # the aggregator is never advertised to the other processes
+    assert not any(
+        v.startswith("%d:/" % logging.INFO) for v in os.environ.values()
+    )
+
+
+def _handler_types(queue):
+    queue.put(
+        sorted(type(h).__name__ for h in logging.getLogger("bob").handlers)
+    )
+
+
+def test_fork_keeps_handlers():
+    # without the asynchronous and aggregation modes, forked processes keep
+    # the handlers of their parent
+    logger = logging.getLogger("bob")
+    handlers = list(logger.handlers)
+    try:
+        logger.handlers.clear()
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_handler_types, args=(queue,))
+        process.start()
+        assert queue.get(timeout=10) == []
+        process.join()
+    finally:
+        logger.handlers[:] = handlers
+
+
+class _Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_log_filters():
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_streams = _capture(stdout, stderr)
+    try:
+        clock = _Clock()
+        rate_limit = log.RateLimitFilter(rate=2, burst=3)
+        rate_limit._clock = clock
+        logger = log.setup(
+            "bob.test_log.rate", format="%(message)s", filters=[rate_limit]
+        )
+        for i in range(10):
+            logger.warning("missing annotation for sample %d", i)
+        logger.warning("another message")
+        assert stderr.getvalue().splitlines() == [
+            "missing annotation for sample 0",
+            "missing annotation for sample 1",
+            "missing annotation for sample 2",
+            "another message",
+        ]
+        # one token per half second
+        clock.now = 0.5
+        logger.warning("missing annotation for sample %d", 10)
+        logger.warning("missing annotation for sample %d", 11)
+        assert stderr.getvalue().splitlines()[-1] == (
+            "missing annotation for sample 10 (7 similar messages were "
+            "suppressed)"
+        )
+        log._filters.filters.remove(rate_limit)
+
+        stderr.seek(0)
+        stderr.truncate()
+        deduplicate = log.DeduplicateFilter(interval=10)
+        deduplicate._clock = clock
+        logger = log.setup(
+            "bob.test_log.dedup", format="%(message)s", filters=[deduplicate]
+        )
+        for i in range(5):
+            clock.now = i
+            logger.warning("falling back to %s", "cpu")
+        clock.now = 11
+        logger.warning("falling back to %s", "cpu")
+        assert stderr.getvalue().splitlines() == [
+            "falling back to cpu",
+            "falling back to cpu (4 similar messages were suppressed)",
+        ]
+
+        # messages that are not strings pass
+        stderr.seek(0)
+        stderr.truncate()
+        for i in range(2):
+            logger.warning(["a", "list"])
+        assert stderr.getvalue() == "['a', 'list']\n" * 2
+    finally:
+        log._filters.filters.clear()
+        _capture(*old_streams)
+
+
+def test_log_filters_child_loggers_and_summaries():
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_streams = _capture(stdout, stderr)
+    try:
+        clock = _Clock()
+        deduplicate = log.DeduplicateFilter(interval=10)
+        deduplicate._clock = clock
+        log.setup("bob", format="%(name)s: %(message)s", filters=[deduplicate])
+        # the records of the children of the logger are filtered too
+        child = logging.getLogger("bob.test_log.child.module")
+        for i in range(5):
+            clock.now = i
+            child.warning("cannot find %s", "x")
+        assert stderr.getvalue() == "bob.test_log.child.module: cannot find x\n"
+
+        # the suppressed records are reported when the message stops recurring
+        clock.now = 20
+        child.warning("another message")
+        assert stderr.getvalue().splitlines()[1:] == [
+            "bob.test_log.child.module: cannot find x (4 similar messages were "
+            "suppressed)",
+            "bob.test_log.child.module: another message",
+        ]
+
+        # or when the logs are flushed
+        child.warning("another message")
+        log.flush()
+        assert stderr.getvalue().splitlines()[3:] == [
+            "bob.test_log.child.module: another message (1 similar messages "
+            "were suppressed)",
+        ]
+    finally:
+        log._filters.filters.clear()
+        _capture(*old_streams)
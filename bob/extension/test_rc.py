@@ -1,17 +1,41 @@
 """Tests for the global bob's configuration functionality"""
 
+import asyncio
+import json
+import logging
 import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
 import pkg_resources
 
 from click.testing import CliRunner
 
-from .rc_config import ENVNAME, _loadrc
+from . import rc, rc_config, rc_context
+from .rc_config import (
+    ENVNAME,
+    KeyIndex,
+    SQLiteBackend,
+    _get_backend,
+    _LazyRC,
+    _loadrc,
+    _saverc,
+    transaction,
+    with_rc_context,
+)
 from .scripts import main_cli
 from .scripts.click_helper import assert_click_runner_result
 
 path = pkg_resources.resource_filename("bob.extension", "data")
 
+logger = logging.getLogger(__name__)
+
 
 def test_rc_env():
 
@@ -105,3 +129,379 @@ def test_bob_config():
             main_cli, ["config", "get", "bob.db.atnt"], env={ENVNAME: bobrcfile}
         )
         assert_click_runner_result(result, 1)
+
+
+def test_rc_startup():
+    old_environ = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            rcfile = os.path.join(tmpdir, "bobrc")
+            os.environ[ENVNAME] = rcfile
+
+            # the rc is not read before it is accessed
+            with open(rcfile, "wt") as f:
+                f.write("not json")
+            lazy_rc = _LazyRC()
+            try:
+                lazy_rc.get("key")
+                assert False, "The code above should have raised a ValueError"
+            except ValueError:
+                pass
+
+            # a large rc file, as written by many packages
+            context = {
+                f"bob.db.{i}": {"directory": f"/data/{i}", "extension": ".hdf5"}
+                for i in range(2000)
+            }
+            with open(rcfile, "wt") as f:
+                json.dump(context, f)
+
+            c = _loadrc()
+            assert c == context
+            assert c["bob.db.1"]["random"] is None
+            assert c["random"] is None
+
+            # the file is read again when it changes
+            with open(rcfile, "wt") as f:
+                json.dump({"a": 1}, f)
+            assert _loadrc() == {"a": 1}
+
+            lazy_rc.invalidate()
+            assert lazy_rc.get("a") == 1
+            assert lazy_rc.get("b", 2) == 2
+            assert lazy_rc["b"] is None
+            with rc_context({"b": 2}):
+                assert rc.get("b") == 2
+        finally:
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+
+_INCREMENT = """
+from bob.extension.rc_config import transaction
+for _ in range(20):
+    with transaction() as context:
+        context["counter"] = (context["counter"] or 0) + 1
+"""
+
+
+def test_rc_transaction():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rcfile = os.path.join(tmpdir, "bobrc")
+        env = dict(os.environ, **{ENVNAME: rcfile})
+
+        # concurrent read-modify-write cycles do not lose updates
+        processes = [
+            subprocess.Popen([sys.executable, "-c", _INCREMENT], env=env)
+            for _ in range(4)
+        ]
+        for p in processes:
+            assert p.wait() == 0
+
+        old_environ = dict(os.environ)
+        try:
+            os.environ.update(env)
+            assert _loadrc() == {"counter": 80}
+
+            # nothing is written if the transaction fails
+            try:
+                with transaction() as context:
+                    context["counter"] = 0
+                    with transaction() as nested:
+                        assert nested is context
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+            assert _loadrc() == {"counter": 80}
+            assert sorted(os.listdir(tmpdir)) == ["bobrc", "bobrc.lock"]
+        finally:
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+
+def test_rc_watch():
+    old_environ = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            os.environ[ENVNAME] = os.path.join(tmpdir, "bobrc")
+            _saverc({"a": 1, "b": 2})
+
+            lazy_rc = _LazyRC()
+            notified = threading.Event()
+            changes = []
+
+            def callback(changed):
+                changes.append(changed)
+                notified.set()
+
+            lazy_rc.subscribe(callback)
+            assert lazy_rc["a"] == 1
+            watcher = lazy_rc.watch(interval=0.01)
+            try:
+                assert lazy_rc.watch() is watcher
+                _saverc({"a": 1, "b": 3, "c": 4})
+                assert notified.wait(5)
+                assert changes == [{"b", "c"}], changes
+                assert lazy_rc["b"] == 3
+            finally:
+                watcher.stop()
+            assert not watcher.is_alive()
+
+            lazy_rc.unsubscribe(callback)
+            _saverc({})
+            assert lazy_rc.changed()
+            assert lazy_rc.reload() == {"a", "b", "c"}
+            assert len(changes) == 1
+        finally:
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+
+def test_rc_layers():
+    old_environ = dict(os.environ)
+    old_cwd = os.getcwd()
+    old_system = rc_config.SYSTEM_RCFILENAMES
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            system_rc = os.path.join(tmpdir, "system")
+            with open(system_rc, "wt") as f:
+                json.dump({"a": "system", "b": "system", "c": "system"}, f)
+            rc_config.SYSTEM_RCFILENAMES = (system_rc,)
+            os.environ[ENVNAME] = os.path.join(tmpdir, "user")
+            _saverc({"b": "user", "c": "user", "d": "user"})
+            project = os.path.join(tmpdir, "project")
+            os.makedirs(os.path.join(project, "subfolder"))
+            with open(os.path.join(project, ".bobrc"), "wt") as f:
+                json.dump({"c": "project"}, f)
+            os.chdir(os.path.join(project, "subfolder"))
+            os.environ["BOBRC_D"] = "env"
+            os.environ["BOBRC_BOB__DB__E"] = "env"
+
+            lazy_rc = _LazyRC()
+            assert dict(lazy_rc) == {
+                "a": "system",
+                "b": "user",
+                "c": "project",
+                "d": "env",
+                "bob.db.e": "env",
+            }, dict(lazy_rc)
+
+            # project files of other users or above the home directory are
+            # ignored
+            project_rc = os.path.join(project, ".bobrc")
+            assert rc_config._get_project_rc_path() == project_rc
+            uid = os.stat(project_rc).st_uid
+            with mock.patch.object(os, "getuid", lambda: uid + 1):
+                assert rc_config._get_project_rc_path() is None
+            with mock.patch.dict(
+                os.environ, {"HOME": os.path.join(project, "subfolder")}
+            ):
+                assert rc_config._get_project_rc_path() is None
+
+            # changes are written into the user's rc file only
+            with transaction() as context:
+                assert context == {"b": "user", "c": "user", "d": "user"}
+                context["a"] = "user"
+            assert lazy_rc.changed()
+            assert lazy_rc.reload() == {"a"}
+            assert lazy_rc["a"] == "user"
+
+            del os.environ["BOBRC_D"]
+            assert lazy_rc.changed()
+            assert lazy_rc.reload() == {"d"}
+            assert lazy_rc["d"] == "user"
+            assert not lazy_rc.changed()
+
+            # saving the merged view only writes its changes to the user's rc
+            lazy_rc["f"] = "new"
+            del lazy_rc["b"]
+            _saverc(lazy_rc)
+            with transaction() as context:
+                assert context == {
+                    "a": "user",
+                    "c": "user",
+                    "d": "user",
+                    "f": "new",
+                }
+            assert lazy_rc.reload() == {"b"}
+            assert lazy_rc["b"] == "system"
+
+            runner = CliRunner()
+            result = runner.invoke(main_cli, ["config", "show"])
+            assert_click_runner_result(result)
+            assert result.output.startswith(
+                "Displaying `{}', `{}', `{}', the environment:".format(
+                    system_rc,
+                    os.path.join(tmpdir, "user"),
+                    os.path.join(project, ".bobrc"),
+                )
+            ), result.output
+        finally:
+            rc_config.SYSTEM_RCFILENAMES = old_system
+            os.chdir(old_cwd)
+            os.environ.clear()
+            os.environ.update(old_environ)
+            rc.invalidate()
+
+
+def test_rc_context_isolation():
+    # each thread sees its own overrides, even when they overlap in time
+    barrier = threading.Barrier(4)
+
+    def worker(i):
+        with rc_context({"key": i}):
+            barrier.wait()
+            time.sleep(0.01)
+            return rc["key"]
+
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(worker, range(4))) == [0, 1, 2, 3]
+
+    # and so does each asyncio task
+    async def task(i):
+        with rc_context({"key": i}):
+            await asyncio.sleep(0.01)
+            return rc.get("key")
+
+    async def main():
+        return await asyncio.gather(*[task(i) for i in range(4)])
+
+    assert asyncio.run(main()) == [0, 1, 2, 3]
+
+    with rc_context({"a": 1, "b": 2}):
+        with rc_context({"a": 3}):
+            assert rc["a"] == 3 and rc["b"] == 2
+            rc["c"] = 4
+            del rc["b"]
+            assert "b" not in rc and rc.get("b", 5) == 5
+            assert {"a": 3, "c": 4}.items() <= rc.copy().items()
+            assert "b" not in dict(rc)
+        assert rc["a"] == 1 and rc["b"] == 2 and "c" not in rc
+
+        # the overrides are only passed explicitly to thread pools
+        with ThreadPoolExecutor(1) as executor:
+            assert executor.submit(rc.get, "a").result() is None
+            assert executor.submit(with_rc_context(rc.get), "a").result() == 1
+    assert "a" not in rc
+
+
+def test_rc_sqlite():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rcfile = os.path.join(tmpdir, "bobrc")
+        env = {ENVNAME: rcfile}
+        runner = CliRunner(env=env)
+        with open(rcfile, "wt") as f:
+            json.dump(
+                {f"bob.db.{i}.directory": f"/data/{i}" for i in range(20)}, f
+            )
+
+        result = runner.invoke(main_cli, ["config", "migrate", "sqlite"])
+        assert_click_runner_result(result)
+        with open(rcfile, "rb") as f:
+            assert f.read(16) == SQLiteBackend.magic
+        backend = _get_backend(rcfile)
+        assert isinstance(backend, SQLiteBackend)
+        assert len(_loadrc(rcfile)) == 20
+
+        result = runner.invoke(main_cli, ["config", "set", "bob.db.x", "y"])
+        assert_click_runner_result(result)
+        result = runner.invoke(main_cli, ["config", "get", "bob.db.x"])
+        assert_click_runner_result(result)
+        assert result.output == "y\n", result.output
+        assert backend.search(prefix="bob.db.1") == [
+            "bob.db.1.directory",
+            "bob.db.10.directory",
+        ] + [f"bob.db.1{i}.directory" for i in range(1, 10)]
+        assert backend.search(contains="db.5") == ["bob.db.5.directory"]
+
+        result = runner.invoke(main_cli, ["config", "unset", "-f", "bob.db.1"])
+        assert_click_runner_result(result)
+        result = runner.invoke(
+            main_cli, ["config", "unset", "-f", "--contain", "directory"]
+        )
+        assert_click_runner_result(result)
+        assert _loadrc(rcfile) == {"bob.db.x": "y"}
+
+        # only the modified keys are written in transactions
+        with backend.transaction() as context:
+            context["a"] = {"b": 1}
+        assert _loadrc(rcfile)["a"]["b"] == 1
+        assert _loadrc(rcfile)["a"]["c"] is None
+        try:
+            with backend.transaction() as context:
+                del context["a"]
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        assert backend.get("a") == {"b": 1}
+        assert backend.get_many(["a", "bob.db.x", "missing"]) == {
+            "a": {"b": 1},
+            "bob.db.x": "y",
+            "missing": None,
+        }
+
+        result = runner.invoke(main_cli, ["config", "migrate", "json"])
+        assert_click_runner_result(result)
+        with open(rcfile, "rt") as f:
+            assert json.load(f) == {"a": {"b": 1}, "bob.db.x": "y"}
+
+
+def test_key_index():
+    keys = [f"bob.db.{i}.{name}" for i in range(10000) for name in ("a", "bc")]
+    keys.append("bob_data_folder")
+    start = time.perf_counter()
+    index = KeyIndex(keys + keys[:10])
+    assert len(index) == len(keys)
+    assert index.prefix("bob.db.99.") == ["bob.db.99.a", "bob.db.99.bc"]
+    assert index.prefix("bob.db.999") == sorted(
+        k for k in keys if k.startswith("bob.db.999")
+    )
+    assert index.contains("9.b") == sorted(k for k in keys if "9.b" in k)
+    assert index.contains("b_") == ["bob_data_folder"]
+    assert index.glob("bob.db.1?.a") == [f"bob.db.{i}.a" for i in range(10, 20)]
+    assert index.regex(r"^bob\.db\.\d{2}\.b") == sorted(
+        f"bob.db.{i}.bc" for i in range(10, 100)
+    )
+    assert index.search(prefix="bob.db.1", contains="b", glob="*.bc") == sorted(
+        k for k in keys if k.startswith("bob.db.1") and k.endswith(".bc")
+    )
+    logger.info(
+        "Indexing and searching 20000 keys took %.1fms",
+        (time.perf_counter() - start) * 1000,
+    )
+
+    with rc_context({"bob.test.a": 1, "bob.test.b": 2}):
+        del rc["bob.test.b"]
+        assert rc.search(prefix="bob.test.") == ["bob.test.a"]
+
+
+def test_bob_config_list():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rcfile = os.path.join(tmpdir, "bobrc")
+        runner = CliRunner(env={ENVNAME: rcfile})
+        with open(rcfile, "wt") as f:
+            json.dump(
+                {"bob.db.atnt": "1", "bob.db.atnt2": "2", "other": "3"}, f
+            )
+
+        result = runner.invoke(main_cli, ["config", "list"])
+        assert_click_runner_result(result)
+        assert result.output == "bob.db.atnt\nbob.db.atnt2\nother\n"
+        result = runner.invoke(
+            main_cli, ["config", "list", "-p", "bob.", "-g", "*2", "--values"]
+        )
+        assert_click_runner_result(result)
+        assert result.output == "bob.db.atnt2: 2\n", result.output
+        result = runner.invoke(main_cli, ["config", "list", "-r", "t$"])
+        assert_click_runner_result(result)
+        assert result.output == "bob.db.atnt\n", result.output
+        result = runner.invoke(main_cli, ["config", "list", "-r", "("])
+        assert_click_runner_result(result, exit_code=2)
+
+        # keys matching both the prefix and the substring are listed once
+        result = runner.invoke(
+            main_cli, ["config", "unset", "--contain", "bob.db"], input="y\n"
+        )
+        assert_click_runner_result(result)
+        assert result.output.count("bob.db.atnt2") == 1, result.output
+        assert _loadrc(rcfile) == {"other": "3"}
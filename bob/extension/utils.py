@@ -5,6 +5,8 @@
 
 """General utilities for building extensions"""
 
+import contextlib
+import fcntl
 import os
 import re
 import sys
@@ -48,6 +50,45 @@ def find_packages(directories=["bob"]):
     return packages
 
 
+@contextlib.contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """Holds an advisory (``flock``) lock on ``path`` for the duration of the
+    context. The lock file is created if it does not exist yet. Advisory locks
+    are released automatically by the operating system when the holding process
+    dies, so a crashed process never leaves a stale lock behind.
+
+    Parameters
+    ----------
+    path : str
+        Path to the lock file.
+    shared : bool
+        If True, a shared (read) lock is taken instead of an exclusive one.
+    blocking : bool
+        If False, do not wait for the lock and yield ``False`` if it is held by
+        another process.
+
+    Yields
+    ------
+    bool
+        Whether the lock was acquired. This is always True when ``blocking`` is
+        True.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def link_documentation(
     additional_packages=["python", "numpy"],
     requirements_file="../requirements.txt",
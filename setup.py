@@ -30,6 +30,8 @@ setup(
         ],
         "bob.cli": [
             "config = bob.extension.scripts.config:config",
+            "data = bob.extension.scripts.data:data",
+            "plugins = bob.extension.scripts.plugins:plugins",
         ],
         # some test entry_points
         "bob.extension.test_config_load": [
@@ -40,6 +42,10 @@ setup(
             "resource1 = bob.extension.data.resource_config2",
             "resource2 = bob.extension.data.resource_config2:b",
         ],
+        "bob.extension.test_artifacts": [
+            "folders = bob.extension.data.artifacts:folders",
+            "readme = bob.extension.data.artifacts:readme",
+        ],
         "bob.extension.test_dump_config": [
             "basic_config = bob.extension.data.basic_config",
             "resource_config = bob.extension.data.resource_config",